@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['specialization', 'is_available', '-rating'], name='doctor_routing_idx'),
+        ),
+    ]
@@ -72,5 +72,11 @@ class Doctor(models.Model):
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=4.5)  # Dummy rating
     is_available = models.BooleanField(default=True)
     
+    class Meta:
+        indexes = [
+            # Top available doctors per specialization (symptom checker routing)
+            models.Index(fields=['specialization', 'is_available', '-rating'], name='doctor_routing_idx'),
+        ]
+    
     def __str__(self):
         return f"Dr. {self.user.get_full_name() or self.user.username} ({self.get_specialization_display()})"
@@ -5,6 +5,8 @@ from rest_framework import serializers
 from accounts.models import Doctor, User
 from hospitals.models import Hospital
 from appointments.models import Appointment, ConsultationSummary
+from appointments.booking import save_booking
+from appointments.scheduling import SlotUnavailable, check_slot
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -70,6 +72,20 @@ class AppointmentSerializer(serializers.ModelSerializer):
                 if appointment_time < current_time:
                     raise serializers.ValidationError("Cannot book appointments for past times today.")
         
+        # The doctor must work then and the slot must be free; partial
+        # updates fall back on the appointment's current values
+        instance = self.instance
+        doctor_id = data.get('doctor_id', instance.doctor_id if instance else None)
+        appointment_date = appointment_date or (instance.appointment_date if instance else None)
+        appointment_time = appointment_time or (instance.appointment_time if instance else None)
+        if doctor_id is not None and appointment_date and appointment_time:
+            if 'doctor_id' in data and not Doctor.objects.filter(pk=doctor_id).exists():
+                raise serializers.ValidationError({'doctor_id': "Doctor not found."})
+            try:
+                check_slot(doctor_id, appointment_date, appointment_time, appointment=instance)
+            except SlotUnavailable as e:
+                raise serializers.ValidationError({'appointment_time': str(e)})
+        
         return data
     
     def create(self, validated_data):
@@ -78,7 +94,19 @@ class AppointmentSerializer(serializers.ModelSerializer):
         doctor = Doctor.objects.get(pk=doctor_id)
         validated_data['doctor'] = doctor
         validated_data['patient'] = self.context['request'].user
-        return super().create(validated_data)
+        return self._book(Appointment(**validated_data))
+    
+    def update(self, instance, validated_data):
+        """Reschedule through the booking service as well"""
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        return self._book(instance)
+    
+    def _book(self, appointment):
+        try:
+            return save_booking(appointment)
+        except SlotUnavailable as e:
+            raise serializers.ValidationError({'appointment_time': str(e)})
 
 
 class ConsultationSummarySerializer(serializers.ModelSerializer):
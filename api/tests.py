@@ -0,0 +1,125 @@
+"""
+Tests for the REST API
+Run with: python manage.py test api
+"""
+import json
+from datetime import date, time, timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from accounts.models import Doctor
+from appointments.models import Appointment
+from api.views import SymptomBatchThrottle
+
+
+class SymptomBatchTest(TestCase):
+    """Test the batch symptom analysis endpoint"""
+
+    def setUp(self):
+        # Throttle counts live in the cache
+        cache.clear()
+        self.client.force_login(get_user_model().objects.create_user(username='clinic', role='patient'))
+
+    def post(self, body, content_type='application/json'):
+        return self.client.post(reverse('api:symptom_batch'), body, content_type=content_type)
+
+    def read_lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_json_array(self):
+        """Test that each record gets one result line, in order"""
+        response = self.post(json.dumps([
+            {'id': 'a1', 'symptoms': 'chest pain and fever', 'age': 50},
+            {'id': 'a2', 'symptoms': 'itchy rash', 'age': 2, 'gender': 'F'},
+        ]))
+        lines = self.read_lines(response)
+        self.assertEqual([line['id'] for line in lines], ['a1', 'a2'])
+        self.assertEqual(lines[0]['category'], 'chest_discomfort')
+        self.assertEqual(lines[0]['concern_level'], 'severe')
+        self.assertEqual(lines[1]['category'], 'skin_issues')
+        self.assertEqual(lines[1]['concern_level'], 'moderate')
+
+    def test_ndjson_input(self):
+        """Test that NDJSON request bodies are accepted"""
+        body = '{"symptoms": "migraine"}\n\n{"symptoms": "cough", "category": "fever"}\n'
+        lines = self.read_lines(self.post(body, content_type='application/x-ndjson'))
+        self.assertEqual([line['category'] for line in lines], ['headache', 'fever'])
+        self.assertEqual([line['index'] for line in lines], [0, 1])
+
+        lines = self.read_lines(self.post(body, content_type='application/x-ndjson; charset=utf-8'))
+        self.assertEqual(len(lines), 2)
+
+    def test_bad_records_do_not_fail_the_batch(self):
+        """Test that invalid records get an error line"""
+        lines = self.read_lines(self.post(json.dumps([
+            {'age': 30}, {'symptoms': 'fever', 'age': 'old'}, 'fever', {'symptoms': 'fever'},
+        ])))
+        self.assertEqual(['error' in line for line in lines], [True, True, True, False])
+
+        lines = self.read_lines(self.post('[{"symptoms": "fever", "age": 1e999}]'))
+        self.assertIn('error', lines[0])
+
+    def test_requires_authentication(self):
+        """Test that anonymous callers cannot use the compute endpoint"""
+        self.client.logout()
+        self.assertEqual(self.post(json.dumps([{'symptoms': 'fever'}])).status_code, 403)
+
+    def test_batches_are_throttled(self):
+        """Test that one account cannot send unlimited batches"""
+        with mock.patch.object(SymptomBatchThrottle, 'get_rate', return_value='2/hour'):
+            statuses = [self.post(json.dumps([{'symptoms': 'fever'}])).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_rejects_bad_bodies(self):
+        """Test that malformed or oversized batches return 400"""
+        self.assertEqual(self.post('{not json').status_code, 400)
+        self.assertEqual(self.post(json.dumps({'symptoms': 'fever'})).status_code, 400)
+        with mock.patch('api.views.MAX_SYMPTOM_BATCH', 2):
+            self.assertEqual(self.post(json.dumps([{'symptoms': 'fever'}] * 3)).status_code, 400)
+
+
+class AppointmentStatusApiTest(TestCase):
+    """Test that the appointment status actions go through the booking service"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.patient = User.objects.create_user(username='patient', role='patient')
+        self.other_patient = User.objects.create_user(username='patient2', role='patient')
+        doctor_user = User.objects.create_user(username='doctor', role='doctor')
+        self.doctor = Doctor.objects.create(
+            user=doctor_user, specialization='cardiology', qualification='MD', clinic_hospital='City Hospital',
+        )
+        self.client.force_login(doctor_user)
+        self.appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, appointment_date=date.today() + timedelta(days=7 - date.today().weekday()),
+            appointment_time=time(10), symptoms='chest pain',
+        )
+
+    def post_status(self, value):
+        url = reverse('api:appointment-update-status', args=[self.appointment.pk])
+        return self.client.post(url, {'status': value}, content_type='application/json')
+
+    def test_reopening_a_taken_slot_is_rejected(self):
+        """Test that reopening a cancelled appointment whose slot was rebooked returns 400"""
+        cancel = self.client.post(reverse('api:appointment-cancel', args=[self.appointment.pk]))
+        self.assertEqual(cancel.status_code, 200)
+        Appointment.objects.create(
+            patient=self.other_patient, doctor=self.doctor, appointment_date=self.appointment.appointment_date,
+            appointment_time=time(10), symptoms='fever',
+        )
+
+        response = self.post_status('pending')
+        self.assertEqual(response.status_code, 400)
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, 'cancelled')
+
+    def test_reopening_a_free_slot(self):
+        """Test that a cancelled appointment can be reopened while its slot is free"""
+        self.post_status('cancelled')
+        response = self.post_status('confirmed')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'confirmed')
@@ -14,5 +14,6 @@ router.register(r'appointments', views.AppointmentViewSet, basename='appointment
 router.register(r'consultation-summaries', views.ConsultationSummaryViewSet, basename='consultation-summary')
 
 urlpatterns = [
+    path('symptoms/batch/', views.symptom_batch, name='symptom_batch'),
     path('', include(router.urls)),
 ]
@@ -1,18 +1,27 @@
 """
 API Views using Django REST Framework
 """
+import json
 from rest_framework import viewsets, filters, permissions, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
+from rest_framework.throttling import UserRateThrottle
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from accounts.models import Doctor
 from hospitals.models import Hospital
+from appointments.booking import save_booking
 from appointments.models import Appointment, ConsultationSummary
+from appointments.scheduling import MAX_NEXT_SLOTS, SlotUnavailable, next_available_slots
+from symptoms.symptom_checker import SymptomChecker
 from .serializers import (
     DoctorSerializer, HospitalSerializer, AppointmentSerializer,
     ConsultationSummarySerializer
 )
 
+# Slots returned by /api/doctors/next-available/ without ?count
+DEFAULT_NEXT_SLOTS = 5
+
 
 class DoctorViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -33,6 +42,34 @@ class DoctorViewSet(viewsets.ReadOnlyModelViewSet):
         if specialization:
             queryset = queryset.filter(specialization=specialization)
         return queryset
+    
+    @action(detail=False, methods=['get'], url_path='next-available')
+    def next_available(self, request):
+        """
+        Earliest free slots across all available doctors of a specialization.
+        GET /api/doctors/next-available/?specialization=general&count=5
+        """
+        specialization = request.query_params.get('specialization', '')
+        if specialization not in dict(Doctor.SPECIALIZATION_CHOICES):
+            return Response({'error': 'Unknown or missing specialization.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            count = int(request.query_params.get('count', DEFAULT_NEXT_SLOTS))
+        except ValueError:
+            return Response({'error': 'count must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+        count = min(max(count, 1), MAX_NEXT_SLOTS)
+        
+        slots = next_available_slots(specialization, count)
+        return Response({
+            'specialization': specialization,
+            'slots': [
+                {
+                    'appointment_date': start.date(),
+                    'appointment_time': start.time(),
+                    'doctor': DoctorSerializer(doctor).data,
+                }
+                for start, doctor in slots
+            ],
+        })
 
 
 class HospitalViewSet(viewsets.ReadOnlyModelViewSet):
@@ -81,12 +118,14 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         - Doctors see appointments where they are the doctor
         """
         user = self.request.user
+        # The serializer nests the patient and the doctor's user
+        appointments = Appointment.objects.select_related('doctor__user', 'patient')
         if user.role == 'patient':
-            return Appointment.objects.filter(patient=user)
+            return appointments.filter(patient=user)
         elif user.role == 'doctor':
             try:
                 doctor_profile = user.doctor_profile
-                return Appointment.objects.filter(doctor=doctor_profile)
+                return appointments.filter(doctor=doctor_profile)
             except:
                 return Appointment.objects.none()
         return Appointment.objects.none()
@@ -109,7 +148,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         
         if appointment.status not in ['completed', 'cancelled']:
             appointment.status = 'cancelled'
-            appointment.save()
+            save_booking(appointment)
             return Response({'status': 'Appointment cancelled successfully.'})
         else:
             return Response(
@@ -134,7 +173,11 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         
         if new_status in valid_statuses:
             appointment.status = new_status
-            appointment.save()
+            try:
+                # Reopening a cancelled appointment books its slot again
+                save_booking(appointment)
+            except SlotUnavailable as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             serializer = self.get_serializer(appointment)
             return Response(serializer.data)
         else:
@@ -169,3 +212,89 @@ class ConsultationSummaryViewSet(viewsets.ReadOnlyModelViewSet):
             except:
                 return ConsultationSummary.objects.none()
         return ConsultationSummary.objects.none()
+
+
+# Largest number of records accepted in one /api/symptoms/batch/ request
+MAX_SYMPTOM_BATCH = 10000
+
+
+class SymptomBatchThrottle(UserRateThrottle):
+    """Limit batches per partner account (rate in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'])"""
+    scope = 'symptom_batch'
+
+# Result lines sent to the client per write
+SYMPTOM_STREAM_CHUNK = 200
+
+# Result fields streamed back per record (tips and disclaimer are per category, see the HTML page)
+SYMPTOM_BATCH_FIELDS = ('category', 'concern_level', 'recommended_specialist', 'matched_keywords', 'ranked_categories')
+
+
+def parse_symptom_batch(request):
+    """
+    Records from a JSON array body, or NDJSON (one JSON object per line)
+    when the content type is application/x-ndjson. Raises ValueError.
+    """
+    media_type = request.content_type.split(';')[0].strip().lower()
+    if media_type == 'application/x-ndjson':
+        records = [json.loads(line) for line in request.body.splitlines() if line.strip()]
+    else:
+        records = json.loads(request.body or b'null')
+        if isinstance(records, dict):
+            records = records.get('records')
+    if not isinstance(records, list):
+        raise ValueError('Expected a JSON array of records or NDJSON')
+    return records
+
+
+def analyze_symptom_record(index, record):
+    """One NDJSON output line for one input record"""
+    line = {'index': index}
+    try:
+        if isinstance(record, dict) and 'id' in record:
+            line['id'] = record['id']
+        symptoms = record['symptoms']
+        if not isinstance(symptoms, str):
+            raise ValueError('symptoms must be a string')
+        result = SymptomChecker.analyze_symptoms(
+            symptom_description=symptoms,
+            age=int(record.get('age', 25)),
+            gender=record.get('gender', 'O'),
+            category=record.get('category', 'general'),
+        )
+        line.update((field, result[field]) for field in SYMPTOM_BATCH_FIELDS)
+    except (TypeError, KeyError, ValueError, OverflowError) as e:
+        line['error'] = f'Invalid record: {e}'
+    return json.dumps(line) + '\n'
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([SymptomBatchThrottle])
+def symptom_batch(request):
+    """
+    Analyze many symptom records in one request (signed-in partner
+    clinics, throttled per account).
+    POST /api/symptoms/batch/ with a JSON array (or NDJSON lines) of
+    {"id": ..., "symptoms": "...", "age": 30, "gender": "F", "category": "general"}.
+    Results are streamed back as NDJSON, one line per record in input
+    order; bad records get an "error" line instead of failing the batch.
+    """
+    try:
+        records = parse_symptom_batch(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(records) > MAX_SYMPTOM_BATCH:
+        return Response(
+            {'error': f'At most {MAX_SYMPTOM_BATCH} records per request.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def stream():
+        for start in range(0, len(records), SYMPTOM_STREAM_CHUNK):
+            yield ''.join(
+                analyze_symptom_record(index, record)
+                for index, record in enumerate(records[start:start + SYMPTOM_STREAM_CHUNK], start)
+            )
+
+    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
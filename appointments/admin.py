@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Appointment, ConsultationSummary
+from .models import Appointment, ConsultationSummary, DoctorSchedule
 
 
 @admin.register(Appointment)
@@ -14,3 +14,10 @@ class AppointmentAdmin(admin.ModelAdmin):
 class ConsultationSummaryAdmin(admin.ModelAdmin):
     list_display = ['appointment', 'follow_up_required', 'follow_up_date', 'created_at']
     search_fields = ['appointment__patient__username', 'diagnosis']
+
+
+@admin.register(DoctorSchedule)
+class DoctorScheduleAdmin(admin.ModelAdmin):
+    list_display = ['doctor', 'weekday', 'start_time', 'end_time']
+    list_filter = ['weekday']
+    search_fields = ['doctor__user__username']
@@ -0,0 +1,50 @@
+"""
+Concurrency-safe booking
+
+Two patients submitting the same slot at once both pass form validation,
+so the slot is checked again at save time, inside a transaction holding
+the doctor-day row (select_for_update): bookings of one doctor-day are
+serialized while other doctors and days proceed in parallel. The
+unique_booked_slot constraint backs this up for writes that bypass the
+service. A lost race (IntegrityError) or a lock timeout / deadlock
+(OperationalError) is retried after an exponential, jittered backoff; the
+retry then either books or reports the slot as taken.
+"""
+import logging
+import random
+import time
+
+from django.db import IntegrityError, OperationalError, transaction
+
+from .scheduling import BOOKED_STATUSES, SlotUnavailable, check_slot, get_doctor_day
+
+logger = logging.getLogger(__name__)
+
+BOOKING_ATTEMPTS = 5
+
+# First retry waits about this long, doubling after each further conflict
+BOOKING_BACKOFF_SECONDS = 0.02
+
+
+def save_booking(appointment):
+    """
+    Save a new or rescheduled appointment if its slot is free, else raise
+    SlotUnavailable. Returns the appointment.
+    """
+    for attempt in range(BOOKING_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                if appointment.status in BOOKED_STATUSES:
+                    doctor_day = get_doctor_day(appointment.doctor_id, appointment.appointment_date, lock=True)
+                    check_slot(
+                        appointment.doctor_id, appointment.appointment_date, appointment.appointment_time,
+                        appointment=appointment, doctor_day=doctor_day,
+                    )
+                appointment.save()
+            return appointment
+        except (IntegrityError, OperationalError) as e:
+            logger.info('Booking conflict for doctor %s on %s, attempt %d: %s',
+                        appointment.doctor_id, appointment.appointment_date, attempt + 1, e)
+            if attempt + 1 < BOOKING_ATTEMPTS:
+                time.sleep(BOOKING_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+    raise SlotUnavailable("That time could not be booked right now, please try again.")
@@ -5,6 +5,7 @@ from django import forms
 from .models import Appointment, ConsultationSummary
 from accounts.models import Doctor
 from django.utils import timezone
+from .scheduling import SLOT_MINUTES, SlotUnavailable, check_slot
 
 
 class AppointmentForm(forms.ModelForm):
@@ -15,7 +16,7 @@ class AppointmentForm(forms.ModelForm):
         fields = ['doctor', 'appointment_date', 'appointment_time', 'symptoms', 'notes']
         widgets = {
             'appointment_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
-            'appointment_time': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+            'appointment_time': forms.TimeInput(attrs={'type': 'time', 'step': SLOT_MINUTES * 60, 'class': 'form-control'}),
             'symptoms': forms.Textarea(attrs={'rows': 4, 'class': 'form-control'}),
             'notes': forms.Textarea(attrs={'rows': 3, 'class': 'form-control'}),
         }
@@ -42,6 +43,14 @@ class AppointmentForm(forms.ModelForm):
                 current_time = timezone.now().time()
                 if appointment_time < current_time:
                     raise forms.ValidationError("Cannot book appointments for past times today.")
+            
+            # The doctor must work then and the slot must be free
+            doctor = cleaned_data.get('doctor')
+            if doctor:
+                try:
+                    check_slot(doctor.pk, appointment_date, appointment_time, appointment=self.instance)
+                except SlotUnavailable as e:
+                    self.add_error('appointment_time', str(e))
         
         return cleaned_data
 
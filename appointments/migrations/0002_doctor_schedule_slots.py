@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:42
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copies of appointments.scheduling at the time of this migration,
+# so later changes there cannot alter what it does
+SLOT_MINUTES = 30
+BITMAP_BYTES = 6
+BOOKED_STATUSES = ('pending', 'confirmed', 'completed')
+# Default working hours: Monday to Saturday, 9:00 to 17:00
+DEFAULT_WORKDAYS = range(6)
+DEFAULT_FIRST_SLOT = 9 * 60 // SLOT_MINUTES
+DEFAULT_END_SLOT = 17 * 60 // SLOT_MINUTES
+
+
+def to_bitmap(bits):
+    return bits.to_bytes(BITMAP_BYTES, 'little')
+
+
+def backfill_doctor_days(apps, schema_editor):
+    """Build the booked bitmaps of existing appointments (nobody has a schedule yet, so default hours)"""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    DoctorDay = apps.get_model('appointments', 'DoctorDay')
+    working = ((1 << (DEFAULT_END_SLOT - DEFAULT_FIRST_SLOT)) - 1) << DEFAULT_FIRST_SLOT
+    booked = {}
+    rows = Appointment.objects.filter(status__in=BOOKED_STATUSES).values_list(
+        'doctor_id', 'appointment_date', 'appointment_time'
+    )
+    for doctor_id, day, start in rows.iterator():
+        slot = (start.hour * 60 + start.minute) // SLOT_MINUTES
+        booked[doctor_id, day] = booked.get((doctor_id, day), 0) | 1 << slot
+    DoctorDay.objects.bulk_create([
+        DoctorDay(
+            doctor_id=doctor_id, date=day, booked_slots=to_bitmap(bits),
+            open_slots=to_bitmap(working if day.weekday() in DEFAULT_WORKDAYS else 0),
+        )
+        for (doctor_id, day), bits in booked.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_doctor_routing_idx'),
+        ('appointments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField(default=datetime.time(9, 0))),
+                ('end_time', models.TimeField(default=datetime.time(17, 0))),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='accounts.doctor')),
+            ],
+            options={
+                'ordering': ['doctor', 'weekday', 'start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DoctorDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('open_slots', models.BinaryField(default=bytes)),
+                ('booked_slots', models.BinaryField(default=bytes)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_days', to='accounts.doctor')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='doctorday',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date'), name='unique_doctor_day'),
+        ),
+        migrations.RunPython(backfill_doctor_days, migrations.RunPython.noop),
+    ]
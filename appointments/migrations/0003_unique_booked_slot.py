@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:43
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def cancel_double_bookings(apps, schema_editor):
+    """Keep the first booking of each taken slot so the constraint can be added"""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    booked = Appointment.objects.filter(status__in=['pending', 'confirmed', 'completed'])
+    duplicates = (
+        booked.values('doctor_id', 'appointment_date', 'appointment_time')
+        .annotate(count=Count('id'), first=Min('id'))
+        .filter(count__gt=1)
+    )
+    for slot in duplicates:
+        booked.filter(
+            doctor_id=slot['doctor_id'], appointment_date=slot['appointment_date'],
+            appointment_time=slot['appointment_time'],
+        ).exclude(id=slot['first']).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_doctor_schedule_slots'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_double_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'confirmed', 'completed'])), fields=('doctor', 'appointment_date', 'appointment_time'), name='unique_booked_slot'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0002_doctor_routing_idx'),
+        ('appointments', '0003_unique_booked_slot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', '-appointment_date', '-appointment_time', '-id'], name='appointment_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', '-appointment_date', '-appointment_time', '-id'], name='appointment_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'status', '-appointment_date', '-appointment_time', '-id'], name='appointment_doctor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'confirmed'])), fields=['patient', 'appointment_date', 'appointment_time'], name='appointment_active_idx'),
+        ),
+        # The single-column foreign key indexes go once the composite ones exist
+        migrations.AlterField(
+            model_name='appointment',
+            name='doctor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='doctor_appointments', to='accounts.doctor'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='patient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='patient_appointments', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
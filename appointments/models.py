@@ -1,6 +1,8 @@
 """
 Appointment Models for CuraLink
 """
+from datetime import time
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings
 from accounts.models import Doctor
@@ -16,16 +18,20 @@ class Appointment(models.Model):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     )
+    # Statuses that hold on to their slot
+    BOOKED_STATUSES = ('pending', 'confirmed', 'completed')
     
     patient = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='patient_appointments'
+        related_name='patient_appointments',
+        db_index=False,  # appointment_patient_idx leads with it
     )
     doctor = models.ForeignKey(
         Doctor,
         on_delete=models.CASCADE,
-        related_name='doctor_appointments'
+        related_name='doctor_appointments',
+        db_index=False,  # appointment_doctor_idx leads with it
     )
     appointment_date = models.DateField()
     appointment_time = models.TimeField()
@@ -37,6 +43,37 @@ class Appointment(models.Model):
     
     class Meta:
         ordering = ['-appointment_date', '-appointment_time']
+        # id breaks ties the way my_appointments' keyset pages do, so no
+        # list query needs a sort step
+        indexes = [
+            # A patient's appointments, newest first (my_appointments, the API)
+            models.Index(
+                fields=['patient', '-appointment_date', '-appointment_time', '-id'], name='appointment_patient_idx',
+            ),
+            # A doctor's appointments, newest first
+            models.Index(
+                fields=['doctor', '-appointment_date', '-appointment_time', '-id'], name='appointment_doctor_idx',
+            ),
+            # ... filtered by status
+            models.Index(
+                fields=['doctor', 'status', '-appointment_date', '-appointment_time', '-id'],
+                name='appointment_doctor_status_idx',
+            ),
+            # A patient's upcoming appointments; a doctor's are covered by unique_booked_slot
+            models.Index(
+                fields=['patient', 'appointment_date', 'appointment_time'],
+                condition=models.Q(status__in=['pending', 'confirmed']),
+                name='appointment_active_idx',
+            ),
+        ]
+        constraints = [
+            # One booking per doctor and time; cancelled appointments give their slot up
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                condition=models.Q(status__in=['pending', 'confirmed', 'completed']),
+                name='unique_booked_slot',
+            ),
+        ]
     
     def __str__(self):
         return f"Appointment: {self.patient.username} with Dr. {self.doctor.user.get_full_name()} on {self.appointment_date}"
@@ -62,3 +99,54 @@ class ConsultationSummary(models.Model):
     
     def __str__(self):
         return f"Summary for {self.appointment}"
+
+
+class DoctorSchedule(models.Model):
+    """
+    Working-hour template - the hours a doctor sees patients on one weekday.
+    A weekday may have several rows (morning and afternoon clinics).
+    """
+    WEEKDAY_CHOICES = (
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    )
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='schedules')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField(default=time(9))
+    end_time = models.TimeField(default=time(17))
+
+    class Meta:
+        ordering = ['doctor', 'weekday', 'start_time']
+
+    def clean(self):
+        if self.start_time and self.end_time and self.end_time <= self.start_time:
+            raise ValidationError("The end time must be after the start time.")
+
+    def __str__(self):
+        return f"{self.doctor} - {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+
+class DoctorDay(models.Model):
+    """
+    One doctor's day as slot bitmaps (see appointments.scheduling): the
+    slots the doctor works, copied from the working-hour templates, and the
+    slots already booked
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='slot_days')
+    date = models.DateField()
+    open_slots = models.BinaryField(default=bytes)
+    booked_slots = models.BinaryField(default=bytes)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date'], name='unique_doctor_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} on {self.date}"
@@ -0,0 +1,241 @@
+"""
+Slot-based scheduling
+
+A doctor's day is cut into SLOT_MINUTES slots, slot i starting i *
+SLOT_MINUTES after midnight. DoctorSchedule rows are weekly working-hour
+templates. Each DoctorDay row holds two bitmaps of one day: the slots the
+doctor works, copied from the templates when the row is created, and the
+slots already booked. Checking, booking or freeing a slot is then a bit
+operation on a single row, however many appointments the doctor has.
+
+The earliest free slots across all doctors of a specialization come from
+a k-way heap merge of lazy per-doctor slot generators, so only as many
+slots as asked for are ever produced.
+"""
+import heapq
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from accounts.models import Doctor
+from .models import Appointment, DoctorDay, DoctorSchedule
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BITMAP_BYTES = (SLOTS_PER_DAY + 7) // 8
+
+# Hours of doctors who have no DoctorSchedule yet: Monday to Saturday, 9:00 to 17:00
+DEFAULT_WORKING_HOURS = {weekday: ((time(9), time(17)),) for weekday in range(6)}
+
+BOOKED_STATUSES = Appointment.BOOKED_STATUSES
+
+# Days ahead searched for a doctor's next free slots
+SEARCH_DAYS = 14
+
+# Most slots a next-available search returns
+MAX_NEXT_SLOTS = 50
+
+# Next-available answers may be this stale; booking re-checks the slot anyway
+NEXT_SLOTS_CACHE_SECONDS = 30
+
+
+class SlotUnavailable(ValueError):
+    """The requested slot cannot be booked; the message says why"""
+
+
+def slot_index(value):
+    """Index of the slot a time of day falls in"""
+    return (value.hour * 60 + value.minute) // SLOT_MINUTES
+
+
+def slot_time(index):
+    """Start time of a slot"""
+    return time(*divmod(index * SLOT_MINUTES, 60))
+
+
+def to_bitmap(bits):
+    return bits.to_bytes(BITMAP_BYTES, 'little')
+
+
+def from_bitmap(value):
+    # BinaryField gives memoryview on some backends
+    return int.from_bytes(bytes(value), 'little')
+
+
+def hours_mask(ranges):
+    """Bitmap of the slots lying entirely within the (start, end) time ranges"""
+    mask = 0
+    for start, end in ranges:
+        first = -(-(start.hour * 60 + start.minute) // SLOT_MINUTES)
+        last = (end.hour * 60 + end.minute) // SLOT_MINUTES
+        if last > first:
+            mask |= ((1 << (last - first)) - 1) << first
+    return mask
+
+
+def doctor_schedules(doctor_id):
+    """(weekday, start, end) working-hour templates of a doctor"""
+    return list(DoctorSchedule.objects.filter(doctor_id=doctor_id).values_list('weekday', 'start_time', 'end_time'))
+
+
+def working_mask(doctor_id, day, schedules=None):
+    """Bitmap of the slots the doctor works on a date, from the templates"""
+    if schedules is None:
+        schedules = doctor_schedules(doctor_id)
+    if not schedules:
+        return hours_mask(DEFAULT_WORKING_HOURS.get(day.weekday(), ()))
+    return hours_mask((start, end) for weekday, start, end in schedules if weekday == day.weekday())
+
+
+def day_bitmaps(doctor_id, day):
+    """(open, booked) bitmaps of a doctor-day, without creating its row"""
+    row = DoctorDay.objects.filter(doctor_id=doctor_id, date=day).values_list('open_slots', 'booked_slots').first()
+    if row is None:
+        return working_mask(doctor_id, day), 0
+    return from_bitmap(row[0]), from_bitmap(row[1])
+
+
+def available_slots(doctor_id, day):
+    """Start times of the doctor's free slots on a date"""
+    open_slots, booked_slots = day_bitmaps(doctor_id, day)
+    free = open_slots & ~booked_slots
+    return [slot_time(index) for index in range(SLOTS_PER_DAY) if free >> index & 1]
+
+
+def holds_slot(appointment, doctor_id, day, start):
+    """Whether the saved version of an appointment has exactly this slot booked"""
+    if appointment is None or appointment.pk is None:
+        return False
+    stored = Appointment.objects.filter(pk=appointment.pk).values_list(
+        'doctor_id', 'appointment_date', 'appointment_time', 'status'
+    ).first()
+    return stored is not None and stored[3] in BOOKED_STATUSES and stored[:3] == (doctor_id, day, start)
+
+
+def check_slot(doctor_id, day, start, appointment=None, doctor_day=None):
+    """
+    Raise SlotUnavailable unless the doctor can be booked at day/start.
+    `appointment` is the appointment being edited, whose own slot is not
+    a conflict; `doctor_day` a row already fetched (and locked) for the day.
+    """
+    if holds_slot(appointment, doctor_id, day, start):
+        return
+    if (start.hour * 60 + start.minute) % SLOT_MINUTES or start.second or start.microsecond:
+        raise SlotUnavailable(f"Appointments start every {SLOT_MINUTES} minutes, "
+                              f"please pick a time like 10:00 or {slot_time(10 * 60 // SLOT_MINUTES + 1):%H:%M}.")
+    if doctor_day is None:
+        open_slots, booked_slots = day_bitmaps(doctor_id, day)
+    else:
+        open_slots, booked_slots = from_bitmap(doctor_day.open_slots), from_bitmap(doctor_day.booked_slots)
+    index = slot_index(start)
+    if not open_slots >> index & 1:
+        raise SlotUnavailable("The doctor is not available at that time.")
+    if booked_slots >> index & 1:
+        raise SlotUnavailable("That time is already booked, please pick another slot.")
+
+
+def get_doctor_day(doctor_id, day, lock=False):
+    """The doctor-day row, created from the working-hour templates if missing"""
+    queryset = DoctorDay.objects.select_for_update() if lock else DoctorDay.objects.all()
+    try:
+        return queryset.get(doctor_id=doctor_id, date=day)
+    except DoctorDay.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            return DoctorDay.objects.create(
+                doctor_id=doctor_id, date=day,
+                open_slots=to_bitmap(working_mask(doctor_id, day)), booked_slots=to_bitmap(0),
+            )
+    except IntegrityError:
+        # Created concurrently
+        return queryset.get(doctor_id=doctor_id, date=day)
+
+
+def mark_slot(doctor_id, day, start, booked):
+    """Set (booked=True) or clear the booked bit of the slot containing start"""
+    bit = 1 << slot_index(start)
+    with transaction.atomic():
+        if booked:
+            doctor_day = get_doctor_day(doctor_id, day, lock=True)
+        else:
+            # Nothing to free without a row (nor should one be created while the doctor is being deleted)
+            doctor_day = DoctorDay.objects.select_for_update().filter(doctor_id=doctor_id, date=day).first()
+            if doctor_day is None:
+                return
+        bits = from_bitmap(doctor_day.booked_slots)
+        doctor_day.booked_slots = to_bitmap(bits | bit if booked else bits & ~bit)
+        doctor_day.save(update_fields=['booked_slots'])
+
+
+def refresh_open_slots(doctor_id):
+    """Re-apply the doctor's working-hour templates to their days from today on"""
+    schedules = doctor_schedules(doctor_id)
+    days = list(DoctorDay.objects.filter(doctor_id=doctor_id, date__gte=date.today()))
+    for doctor_day in days:
+        doctor_day.open_slots = to_bitmap(working_mask(doctor_id, doctor_day.date, schedules))
+    DoctorDay.objects.bulk_update(days, ['open_slots'])
+
+
+def doctor_free_slots(doctor_id, days, schedules, now):
+    """
+    Yield (start datetime, doctor_id) of a doctor's free slots in time
+    order. `days` maps date -> (open, booked) bitmaps of the dates that
+    have a row; other dates come from `schedules`.
+    """
+    for offset in range(SEARCH_DAYS):
+        day = now.date() + timedelta(days=offset)
+        if day in days:
+            open_slots, booked_slots = days[day]
+        else:
+            open_slots, booked_slots = working_mask(doctor_id, day, schedules), 0
+        free = open_slots & ~booked_slots
+        if day == now.date():
+            # Only slots that have not started yet
+            free &= -1 << (slot_index(now.time()) + 1)
+        while free:
+            index = (free & -free).bit_length() - 1
+            yield datetime.combine(day, slot_time(index)), doctor_id
+            free &= free - 1
+
+
+def next_slots_cache_key(specialization):
+    return f'appointments:next_slots:{specialization}'
+
+
+def next_available_slots(specialization, count):
+    """
+    The `count` (at most MAX_NEXT_SLOTS) earliest free slots across the
+    available doctors of a specialization, as (start datetime, doctor)
+    pairs. Three queries whatever the number of doctors, cached briefly.
+    """
+    key = next_slots_cache_key(specialization)
+    slots = cache.get(key)
+    if slots is None:
+        now = timezone.localtime().replace(tzinfo=None)
+        # Served by doctor_routing_idx (specialization, is_available, ...)
+        doctors = {
+            doctor.pk: doctor
+            for doctor in Doctor.objects.filter(specialization=specialization, is_available=True).select_related('user')
+        }
+        schedules = {doctor_id: [] for doctor_id in doctors}
+        for doctor_id, weekday, start, end in DoctorSchedule.objects.filter(doctor_id__in=doctors).values_list(
+            'doctor_id', 'weekday', 'start_time', 'end_time'
+        ):
+            schedules[doctor_id].append((weekday, start, end))
+        days = {doctor_id: {} for doctor_id in doctors}
+        rows = DoctorDay.objects.filter(
+            doctor_id__in=doctors, date__gte=now.date(), date__lt=now.date() + timedelta(days=SEARCH_DAYS)
+        ).values_list('doctor_id', 'date', 'open_slots', 'booked_slots')
+        for doctor_id, day, open_slots, booked_slots in rows:
+            days[doctor_id][day] = (from_bitmap(open_slots), from_bitmap(booked_slots))
+
+        merged = heapq.merge(*(
+            doctor_free_slots(doctor_id, days[doctor_id], schedules[doctor_id], now) for doctor_id in doctors
+        ))
+        slots = [(start, doctors[doctor_id]) for start, doctor_id in islice(merged, MAX_NEXT_SLOTS)]
+        cache.set(key, slots, NEXT_SLOTS_CACHE_SECONDS)
+    return slots[:count]
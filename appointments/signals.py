@@ -0,0 +1,55 @@
+"""
+Signal handlers for Appointment Management
+"""
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .models import Appointment, DoctorSchedule
+from .scheduling import BOOKED_STATUSES, mark_slot, refresh_open_slots
+
+
+def booked_slot(doctor_id, appointment_date, appointment_time, status):
+    """(doctor_id, date, time) of the slot an appointment holds, or None"""
+    if status not in BOOKED_STATUSES:
+        return None
+    return doctor_id, appointment_date, appointment_time
+
+
+@receiver(pre_save, sender=Appointment)
+def appointment_pre_save(sender, instance, raw=False, **kwargs):
+    """Remember the slot the appointment held before this save"""
+    previous = None
+    if instance.pk is not None and not raw:
+        previous = Appointment.objects.filter(pk=instance.pk).values_list(
+            'doctor_id', 'appointment_date', 'appointment_time', 'status'
+        ).first()
+    instance._previous_slot = booked_slot(*previous) if previous else None
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_post_save(sender, instance, raw=False, **kwargs):
+    """Move the booked bit when the appointment is rescheduled, cancelled or created"""
+    if raw:
+        return
+    before = getattr(instance, '_previous_slot', None)
+    after = booked_slot(instance.doctor_id, instance.appointment_date, instance.appointment_time, instance.status)
+    if before == after:
+        return
+    if before is not None:
+        mark_slot(*before, booked=False)
+    if after is not None:
+        mark_slot(*after, booked=True)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_post_delete(sender, instance, **kwargs):
+    """Free the slot of a deleted appointment"""
+    slot = booked_slot(instance.doctor_id, instance.appointment_date, instance.appointment_time, instance.status)
+    if slot is not None:
+        mark_slot(*slot, booked=False)
+
+
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+def schedule_changed(sender, instance, **kwargs):
+    """Apply the new working hours to the doctor's upcoming days"""
+    refresh_open_slots(instance.doctor_id)
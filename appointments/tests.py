@@ -0,0 +1,385 @@
+"""
+Tests for Appointment Management
+Run with: python manage.py test appointments
+"""
+import threading
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import Doctor
+from .booking import save_booking
+from .forms import AppointmentForm
+from .views import APPOINTMENTS_PER_PAGE, appointment_cursor
+from .models import Appointment, DoctorDay, DoctorSchedule
+from .scheduling import (
+    SlotUnavailable, available_slots, check_slot, hours_mask, next_available_slots, slot_index, slot_time,
+)
+
+
+def next_weekday(weekday):
+    """The first date at least a week ahead falling on weekday"""
+    day = date.today() + timedelta(days=7)
+    return day + timedelta(days=(weekday - day.weekday()) % 7)
+
+
+class SchedulingTest(TestCase):
+    """Test slot bitmaps, working-hour templates and conflict detection"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.patient = User.objects.create_user(username='patient', role='patient')
+        self.other_patient = User.objects.create_user(username='patient2', role='patient')
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create_user(username='doctor', role='doctor'),
+            specialization='cardiology', qualification='MD', clinic_hospital='City Hospital',
+        )
+        self.monday = next_weekday(0)
+
+    def book(self, start, patient=None, day=None):
+        return Appointment.objects.create(
+            patient=patient or self.patient, doctor=self.doctor, appointment_date=day or self.monday,
+            appointment_time=start, symptoms='chest pain',
+        )
+
+    def test_slot_arithmetic(self):
+        """Test slot indexes and masks of working hours"""
+        self.assertEqual(slot_index(time(9, 45)), 19)
+        self.assertEqual(slot_time(19), time(9, 30))
+        # Only whole slots count: 9:15-10:45 covers 9:30 and 10:00
+        self.assertEqual(hours_mask([(time(9, 15), time(10, 45))]), 1 << 19 | 1 << 20)
+
+    def test_default_and_template_hours(self):
+        """Test the default hours and that templates replace them"""
+        slots = available_slots(self.doctor.pk, self.monday)
+        self.assertEqual((slots[0], slots[-1], len(slots)), (time(9), time(16, 30), 16))
+        self.assertEqual(available_slots(self.doctor.pk, next_weekday(6)), [])
+
+        DoctorSchedule.objects.create(doctor=self.doctor, weekday=0, start_time=time(8), end_time=time(9))
+        DoctorSchedule.objects.create(doctor=self.doctor, weekday=0, start_time=time(14), end_time=time(15))
+        self.assertEqual(available_slots(self.doctor.pk, self.monday), [time(8), time(8, 30), time(14), time(14, 30)])
+        self.assertEqual(available_slots(self.doctor.pk, next_weekday(1)), [])
+
+    def test_booking_and_cancelling_update_the_bitmap(self):
+        """Test that the slot is taken on booking and freed on cancel, reschedule and delete"""
+        appointment = self.book(time(10))
+        self.assertNotIn(time(10), available_slots(self.doctor.pk, self.monday))
+        with self.assertRaisesMessage(SlotUnavailable, 'already booked'):
+            check_slot(self.doctor.pk, self.monday, time(10))
+        # The appointment's own slot is no conflict when editing it
+        check_slot(self.doctor.pk, self.monday, time(10), appointment=appointment)
+
+        appointment.appointment_time = time(11)
+        appointment.save()
+        free = available_slots(self.doctor.pk, self.monday)
+        self.assertIn(time(10), free)
+        self.assertNotIn(time(11), free)
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertIn(time(11), available_slots(self.doctor.pk, self.monday))
+
+        self.book(time(12)).delete()
+        self.assertEqual(len(available_slots(self.doctor.pk, self.monday)), 16)
+
+    def test_schedule_change_reaches_existing_days(self):
+        """Test that editing templates updates days that already have a row"""
+        self.book(time(10))
+        DoctorSchedule.objects.create(doctor=self.doctor, weekday=0, start_time=time(13), end_time=time(14))
+        self.assertEqual(available_slots(self.doctor.pk, self.monday), [time(13), time(13, 30)])
+        self.assertEqual(DoctorDay.objects.count(), 1)
+
+    def test_rejects_unavailable_slots(self):
+        """Test off-grid times, hours off and taken slots"""
+        with self.assertRaisesMessage(SlotUnavailable, 'every 30 minutes'):
+            check_slot(self.doctor.pk, self.monday, time(10, 10))
+        with self.assertRaisesMessage(SlotUnavailable, 'not available'):
+            check_slot(self.doctor.pk, self.monday, time(20))
+
+    def test_form_rejects_double_booking(self):
+        """Test that a second patient cannot book the same doctor at the same time"""
+        self.book(time(10))
+        form = AppointmentForm(data={
+            'doctor': self.doctor.pk, 'appointment_date': self.monday, 'appointment_time': '10:00',
+            'symptoms': 'fever',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('appointment_time', form.errors)
+
+        form = AppointmentForm(data={
+            'doctor': self.doctor.pk, 'appointment_date': self.monday, 'appointment_time': '10:30',
+            'symptoms': 'fever',
+        })
+        self.assertTrue(form.is_valid())
+
+    def test_api_rejects_double_booking(self):
+        """Test the serializer's slot check"""
+        self.book(time(10))
+        self.client.force_login(self.other_patient)
+        body = {'doctor_id': self.doctor.pk, 'appointment_date': self.monday, 'appointment_time': '10:00', 'symptoms': 'fever'}
+        response = self.client.post(reverse('api:appointment-list'), body)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('appointment_time', response.json())
+
+        body['appointment_time'] = '10:30'
+        self.assertEqual(self.client.post(reverse('api:appointment-list'), body).status_code, 201)
+        self.assertNotIn(time(10, 30), available_slots(self.doctor.pk, self.monday))
+
+
+class NextAvailableTest(TestCase):
+    """Test the earliest free slots across the doctors of a specialization"""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.patient = User.objects.create_user(username='patient', role='patient')
+        self.doctors = {}
+        for name, specialization, available in [
+            ('default_hours', 'general', True), ('mornings', 'general', True),
+            ('away', 'general', False), ('cardiologist', 'cardiology', True),
+        ]:
+            self.doctors[name] = Doctor.objects.create(
+                user=User.objects.create_user(username=name, role='doctor'), specialization=specialization,
+                qualification='MBBS', clinic_hospital='City Hospital', is_available=available,
+            )
+        DoctorSchedule.objects.create(doctor=self.doctors['mornings'], weekday=0, start_time=time(10), end_time=time(11))
+        self.monday = next_weekday(0)
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctors['default_hours'], appointment_date=self.monday,
+            appointment_time=time(10, 30), symptoms='fever',
+        )
+        # Monday 10:05, so the 10:00 slots have started
+        self.now = mock.patch(
+            'appointments.scheduling.timezone.localtime',
+            return_value=timezone.make_aware(datetime.combine(self.monday, time(10, 5))),
+        )
+        self.now.start()
+        self.addCleanup(self.now.stop)
+
+    def test_merges_doctors_in_time_order(self):
+        """Test the merge skips booked, started and unavailable doctors' slots"""
+        with self.assertNumQueries(3):
+            slots = next_available_slots('general', 4)
+        self.assertEqual([(start.time(), doctor.user.username) for start, doctor in slots], [
+            (time(10, 30), 'mornings'), (time(11), 'default_hours'),
+            (time(11, 30), 'default_hours'), (time(12), 'default_hours'),
+        ])
+        with self.assertNumQueries(0):
+            self.assertEqual(len(next_available_slots('general', 2)), 2)
+
+    def test_api(self):
+        """Test the next-available endpoint"""
+        response = self.client.get(reverse('api:doctor-next-available'), {'specialization': 'general', 'count': 2})
+        self.assertEqual(response.status_code, 200)
+        slots = response.json()['slots']
+        self.assertEqual([(slot['appointment_time'], slot['doctor']['user']['username']) for slot in slots],
+                         [('10:30:00', 'mornings'), ('11:00:00', 'default_hours')])
+        self.assertEqual(slots[0]['appointment_date'], self.monday.isoformat())
+        self.assertEqual(self.client.get(reverse('api:doctor-next-available')).status_code, 400)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class MyAppointmentsTest(TestCase):
+    """Test the appointment list's query count and keyset pagination"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.patient = User.objects.create_user(username='patient', role='patient', first_name='Pat')
+        self.doctors = [
+            Doctor.objects.create(
+                user=User.objects.create_user(username=f'doctor{index}', role='doctor', first_name=f'Doc{index}'),
+                specialization='general', qualification='MBBS', clinic_hospital='City Hospital',
+            )
+            for index in range(2)
+        ]
+
+    def add_appointments(self, count):
+        # Both doctors at each date and time, so pages must break ties on id
+        start, first = next_weekday(0), Appointment.objects.count()
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=self.patient, doctor=self.doctors[index % 2], symptoms='fever',
+                appointment_date=start + timedelta(days=index // 4), appointment_time=time(9 + index // 2 % 2),
+            )
+            for index in range(first, first + count)
+        ])
+
+    def get_pages(self, user):
+        self.client.force_login(user)
+        pages, params = [], {}
+        while True:
+            response = self.client.get(reverse('appointments:my_appointments'), params)
+            pages.append([appointment.pk for appointment in response.context['appointments']])
+            if not response.context['next_cursor']:
+                return pages
+            params = {'after': response.context['next_cursor']}
+
+    def test_constant_queries(self):
+        """Test that the page costs the same number of queries for 2 or 20 appointments"""
+        self.add_appointments(2)
+        self.client.force_login(self.patient)
+        with self.assertNumQueries(3):
+            self.client.get(reverse('appointments:my_appointments'))
+        self.add_appointments(APPOINTMENTS_PER_PAGE)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('appointments:my_appointments'))
+        self.assertContains(response, 'Dr. Doc1')
+
+        self.client.force_login(self.doctors[0].user)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('appointments:my_appointments'))
+        self.assertContains(response, 'Pat')
+
+    def test_keyset_pages(self):
+        """Test that pages are newest first, without gaps or repeats"""
+        self.add_appointments(APPOINTMENTS_PER_PAGE * 2 + 3)
+        pages = self.get_pages(self.patient)
+        self.assertEqual([len(page) for page in pages], [APPOINTMENTS_PER_PAGE, APPOINTMENTS_PER_PAGE, 3])
+        expected = Appointment.objects.order_by('-appointment_date', '-appointment_time', '-id').values_list('pk', flat=True)
+        self.assertEqual(sum(pages, []), list(expected))
+
+        # A cursor that is not one starts over
+        response = self.client.get(reverse('appointments:my_appointments'), {'after': 'nonsense'})
+        self.assertEqual(len(response.context['appointments']), APPOINTMENTS_PER_PAGE)
+
+
+class AppointmentIndexTest(TestCase):
+    """Test that the appointment list queries are served by an index, without a sort step"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.patient = User.objects.create_user(username='patient', role='patient')
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create_user(username='doctor', role='doctor'),
+            specialization='general', qualification='MBBS', clinic_hospital='City Hospital',
+        )
+        monday = next_weekday(0)
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=self.patient, doctor=self.doctor, symptoms='fever', status=status,
+                appointment_date=monday + timedelta(days=index), appointment_time=time(10),
+            )
+            for index, status in enumerate(['pending', 'confirmed', 'completed', 'cancelled'] * 10)
+        ])
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are cheaper to scan; ask for the plan the index allows
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def plan(self, sql, params=None):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, sql, index, params=None):
+        plan = self.plan(sql, params)
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)  # SQLite sorting
+        self.assertNotRegex(plan, r'\bSort\b')  # PostgreSQL sorting
+
+    def test_list_queries(self):
+        """Test the patient, doctor and status-filtered lists"""
+        today = date.today()
+        for queryset, index in [
+            (Appointment.objects.filter(patient=self.patient), 'appointment_patient_idx'),
+            (Appointment.objects.filter(doctor=self.doctor), 'appointment_doctor_idx'),
+            (Appointment.objects.filter(doctor=self.doctor, status='pending'), 'appointment_doctor_status_idx'),
+        ]:
+            with self.subTest(index=index):
+                sql, params = queryset.query.sql_with_params()
+                self.assertUsesIndex(sql, index, params)
+
+        with self.subTest(index='appointment_active_idx'):
+            # Only a query whose WHERE clause implies the index condition can use a
+            # partial index; SQLite needs the literal values to see that
+            plan = self.plan(
+                'SELECT id FROM appointments_appointment WHERE patient_id = %d '
+                "AND status IN ('pending', 'confirmed') AND appointment_date >= '%s' "
+                'ORDER BY appointment_date, appointment_time' % (self.patient.pk, today.isoformat())
+            )
+            self.assertIn('appointment_active_idx', plan)
+
+    def test_keyset_page_query(self):
+        """Test the query my_appointments runs for a later page"""
+        first = Appointment.objects.order_by('-appointment_date', '-appointment_time', '-id')[5]
+        self.client.force_login(self.patient)
+        with CaptureQueriesContext(connection) as queries, override_settings(
+            STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'
+        ):
+            self.client.get(reverse('appointments:my_appointments'), {'after': appointment_cursor(first)})
+        sql = [query['sql'] for query in queries if 'FROM "appointments_appointment"' in query['sql']]
+        self.assertEqual(len(sql), 1)
+        self.assertUsesIndex(sql[0], 'appointment_patient_idx')
+
+
+class ConcurrentBookingTest(TransactionTestCase):
+    """Test that racing bookings never double-book a slot"""
+
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 12
+
+    def setUp(self):
+        User = get_user_model()
+        self.patients = [User.objects.create_user(username=f'patient{index}', role='patient') for index in range(self.THREADS)]
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create_user(username='doctor', role='doctor'),
+            specialization='cardiology', qualification='MD', clinic_hospital='City Hospital',
+        )
+        self.monday = next_weekday(0)
+
+    def test_constraint_rejects_double_booking(self):
+        """Test the database constraint behind the booking service"""
+        fields = dict(doctor=self.doctor, appointment_date=self.monday, appointment_time=time(10), symptoms='fever')
+        Appointment.objects.create(patient=self.patients[0], **fields)
+        Appointment.objects.create(patient=self.patients[1], status='cancelled', **fields)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Appointment.objects.create(patient=self.patients[2], **fields)
+
+    def test_threads_racing_for_slots(self):
+        """Test many threads booking a few slots at once"""
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Threads would share one connection, and so one transaction
+            # (settings give SQLite a file TEST NAME, so only custom setups get here)
+            self.skipTest('Needs a file-based SQLite test database (TEST NAME) or PostgreSQL')
+        slots = [time(9), time(9, 30), time(10), time(10, 30)]
+        outcomes = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(patient):
+            barrier.wait()
+            try:
+                for attempt in range(self.ATTEMPTS_PER_THREAD):
+                    appointment = Appointment(
+                        patient=patient, doctor=self.doctor, appointment_date=self.monday,
+                        appointment_time=slots[attempt % len(slots)], symptoms='fever',
+                    )
+                    try:
+                        save_booking(appointment)
+                        outcome = 'booked'
+                    except SlotUnavailable:
+                        outcome = 'rejected'
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(patient,)) for patient in self.patients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        booked = Counter(Appointment.objects.values_list('appointment_time', flat=True))
+        self.assertEqual(outcomes['booked'] + outcomes['rejected'], self.THREADS * self.ATTEMPTS_PER_THREAD)
+        self.assertEqual(booked, Counter(slots))
+        self.assertEqual(outcomes['booked'], len(slots))
+        free = available_slots(self.doctor.pk, self.monday)
+        self.assertFalse(set(slots) & set(free))
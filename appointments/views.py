@@ -1,14 +1,18 @@
 """
 Views for Appointment Management
 """
+from datetime import date, time
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
+from django.db.models import Q
 from django.http import HttpResponse
 from accounts.models import Doctor
 from .models import Appointment, ConsultationSummary
 from .forms import AppointmentForm, ConsultationSummaryForm
+from .booking import save_booking
+from .scheduling import SlotUnavailable
 
 
 def doctor_list(request):
@@ -63,9 +67,14 @@ def book_appointment(request, doctor_id=None):
         if form.is_valid():
             appointment = form.save(commit=False)
             appointment.patient = request.user
-            appointment.save()
-            messages.success(request, 'Appointment booked successfully!')
-            return redirect('appointments:appointment_confirmation', pk=appointment.pk)
+            try:
+                save_booking(appointment)
+            except SlotUnavailable as e:
+                # Taken by someone else since the form was validated
+                form.add_error('appointment_time', str(e))
+            else:
+                messages.success(request, 'Appointment booked successfully!')
+                return redirect('appointments:appointment_confirmation', pk=appointment.pk)
     else:
         initial_data = {}
         if doctor_id:
@@ -94,6 +103,41 @@ def appointment_confirmation(request, pk):
     return render(request, 'appointments/appointment_confirmation.html', context)
 
 
+# Appointments per page of my_appointments
+APPOINTMENTS_PER_PAGE = 20
+
+
+def appointment_cursor(appointment):
+    """Keyset position of an appointment, as used in ?after="""
+    return f'{appointment.appointment_date.isoformat()}_{appointment.appointment_time.isoformat()}_{appointment.pk}'
+
+
+def keyset_page(appointments, cursor, size=APPOINTMENTS_PER_PAGE):
+    """
+    One page of appointments, newest first, starting after the cursor
+    (see appointment_cursor). Returns the page and the cursor of the next
+    one, or None on the last page. Unlike OFFSET, the cost of a page does
+    not grow with how far back it is.
+    """
+    appointments = appointments.order_by('-appointment_date', '-appointment_time', '-id')
+    if cursor:
+        try:
+            day, start, pk = cursor.split('_')
+            day, start, pk = date.fromisoformat(day), time.fromisoformat(start), int(pk)
+        except ValueError:
+            pass  # Malformed cursor: start from the top
+        else:
+            appointments = appointments.filter(
+                Q(appointment_date__lt=day)
+                | Q(appointment_date=day, appointment_time__lt=start)
+                | Q(appointment_date=day, appointment_time=start, id__lt=pk)
+            )
+    page = list(appointments[:size + 1])
+    if len(page) > size:
+        return page[:size], appointment_cursor(page[size - 1])
+    return page, None
+
+
 @login_required
 def my_appointments(request):
     """
@@ -115,8 +159,15 @@ def my_appointments(request):
     if status:
         appointments = appointments.filter(status=status)
     
+    # The template shows the doctor's and patient's names on every card
+    appointments = appointments.select_related('doctor__user', 'patient')
+    cursor = request.GET.get('after', '')
+    page, next_cursor = keyset_page(appointments, cursor)
+    
     context = {
-        'appointments': appointments,
+        'appointments': page,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
         'status_choices': Appointment.STATUS_CHOICES,
         'selected_status': status,
     }
@@ -139,8 +190,13 @@ def update_appointment_status(request, pk):
         new_status = request.POST.get('status')
         if new_status in dict(Appointment.STATUS_CHOICES):
             appointment.status = new_status
-            appointment.save()
-            messages.success(request, f'Appointment status updated to {appointment.get_status_display()}.')
+            try:
+                # Re-opening a cancelled appointment needs its slot back
+                save_booking(appointment)
+            except SlotUnavailable as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, f'Appointment status updated to {appointment.get_status_display()}.')
     
     return redirect('appointments:my_appointments')
 
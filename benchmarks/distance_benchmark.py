@@ -0,0 +1,90 @@
+"""
+Benchmark: per-row haversine_distance loop vs vectorized DistanceEngine
+
+Compares the old nearby_hospitals approach (one math.sin/cos/asin call
+chain per hospital) against one NumPy pass over the whole set, and times
+a batch distance matrix for map refreshes / coverage jobs.
+
+Usage:
+    python benchmarks/distance_benchmark.py
+    python benchmarks/distance_benchmark.py --sizes 10000 100000 --repeat 5
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from hospitals.distance import DistanceEngine, haversine_distance  # noqa: E402
+
+# Rough bounding box of India
+LAT_RANGE = (8.0, 35.0)
+LON_RANGE = (68.0, 97.0)
+
+
+def random_points(count, seed):
+    rng = random.Random(seed)
+    lats = [rng.uniform(*LAT_RANGE) for _ in range(count)]
+    lons = [rng.uniform(*LON_RANGE) for _ in range(count)]
+    return lats, lons
+
+
+def best_of(repeat, func):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(size, repeat, batch):
+    lats, lons = random_points(size, seed=size)
+    query_lat, query_lon = 28.6139, 77.2090
+    engine = DistanceEngine(range(size), lats, lons)
+
+    def python_loop():
+        return [haversine_distance(query_lat, query_lon, lat, lon) for lat, lon in zip(lats, lons)]
+
+    def vectorized():
+        return engine.distances(query_lat, query_lon)
+
+    loop_time = best_of(repeat, python_loop)
+    numpy_time = best_of(repeat, vectorized)
+
+    # Sanity check: both implementations agree
+    sample = python_loop()[:100]
+    assert max(abs(a - b) for a, b in zip(sample, vectorized()[:100].tolist())) < 1e-6
+
+    query_lats, query_lons = random_points(batch, seed=1)
+    matrix_time = best_of(repeat, lambda: engine.distance_matrix(query_lats, query_lons))
+
+    return {
+        'size': size,
+        'loop_ms': loop_time * 1000,
+        'numpy_ms': numpy_time * 1000,
+        'speedup': loop_time / numpy_time,
+        'matrix_ms': matrix_time * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch', type=int, default=10, help='Query points in the distance matrix run')
+    args = parser.parse_args()
+
+    print(f"{'hospitals':>10} {'loop (ms)':>12} {'numpy (ms)':>12} {'speedup':>9} {f'{args.batch}xN matrix (ms)':>20}")
+    for size in args.sizes:
+        result = run(size, args.repeat, args.batch)
+        print(
+            f"{result['size']:>10} {result['loop_ms']:>12.2f} {result['numpy_ms']:>12.2f} "
+            f"{result['speedup']:>8.1f}x {result['matrix_ms']:>20.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: symptom records per second, HTML form vs batch NDJSON API
+
+Posts the same synthetic records once per record to the symptom checker
+form (form parsing + template rendering per record) and in batches to
+/api/symptoms/batch/, through Django's test client so no server is needed.
+The result cache is cleared before each run.
+
+Usage:
+    python benchmarks/symptom_batch_benchmark.py
+    python benchmarks/symptom_batch_benchmark.py --records 20000 --batch 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'curalink.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+from symptoms.symptom_checker import SymptomChecker  # noqa: E402
+
+PHRASES = [
+    'fever', 'high temperature', 'chills', 'cough', 'runny nose', 'sore throat', 'nausea',
+    'vomiting', 'diarrhea', 'headache', 'migraine', 'chest pain', 'shortness of breath',
+    'rash', 'itching', 'knee', 'back pain', 'anxiety', 'insomnia', 'tired', 'dizzy',
+]
+FILLERS = ['since yesterday', 'for two days', 'and', 'with', 'mild', 'severe', 'at night', 'after eating']
+
+
+def synthetic_records(count, seed):
+    """Short free-text descriptions mixing symptom phrases and filler words"""
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        words = []
+        for _ in range(rng.randint(1, 4)):
+            words += [rng.choice(PHRASES), rng.choice(FILLERS)]
+        records.append({
+            'id': index,
+            'symptoms': ' '.join(words),
+            'age': rng.randint(1, 90),
+            'gender': rng.choice('MFO'),
+        })
+    return records
+
+
+def time_form(client, records):
+    SymptomChecker.cache_clear()
+    start = time.perf_counter()
+    for record in records:
+        response = client.post('/symptoms/', record)
+        assert response.status_code == 200
+    return time.perf_counter() - start
+
+
+def time_batch(client, records, batch):
+    SymptomChecker.cache_clear()
+    start = time.perf_counter()
+    lines = 0
+    for offset in range(0, len(records), batch):
+        body = json.dumps(records[offset:offset + batch])
+        response = client.post('/api/symptoms/batch/', body, content_type='application/json')
+        lines += sum(chunk.count(b'\n') for chunk in response.streaming_content)
+    assert lines == len(records)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=1000, help='Records per API request')
+    parser.add_argument('--form-records', type=int, default=500, help='Records sent through the HTML form')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    client = Client()
+    records = synthetic_records(args.records, seed=1)
+
+    with override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+        form_records = records[:args.form_records]
+        form_time = time_form(client, form_records)
+    batch_time = time_batch(client, records, args.batch)
+
+    form_rate = len(form_records) / form_time
+    batch_rate = len(records) / batch_time
+    print(f"{'path':>12} {'records':>9} {'seconds':>9} {'records/s':>11}")
+    print(f"{'form':>12} {len(form_records):>9} {form_time:>9.2f} {form_rate:>11,.0f}")
+    print(f"{'batch api':>12} {len(records):>9} {batch_time:>9.2f} {batch_rate:>11,.0f}")
+    print(f'speedup: {batch_rate / form_rate:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Benchmark: SymptomChecker latency, allocations and threaded throughput
+
+Generates a synthetic knowledge base (the real categories plus made-up
+keywords up to each vocabulary size) and a corpus of symptom sentences of
+several lengths, some with typos, then for every (vocabulary, length)
+pair measures:
+
+  - analyze_symptoms latency percentiles, uncached (distinct texts) and
+    cached (repeated texts)
+  - memory allocated per uncached call (tracemalloc peak, median)
+  - throughput of uncached calls from a thread pool at several sizes
+
+Results are written as JSON; pass a previous file as --baseline to print
+the relative change of every latency and throughput figure.
+
+Usage:
+    python benchmarks/symptom_benchmark.py
+    python benchmarks/symptom_benchmark.py --vocab 100 5000 --lengths 5 40 --output before.json
+    python benchmarks/symptom_benchmark.py --output after.json --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'curalink.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from symptoms.knowledge import DEFAULT_PATH, get_knowledge_base, reload_knowledge_base  # noqa: E402
+from symptoms.symptom_checker import SymptomChecker  # noqa: E402
+
+SYLLABLES = ['ra', 'to', 'mi', 'ne', 'sul', 'ka', 'dor', 'phe', 'li', 'gan', 'tro', 'vy', 'sem', 'bu']
+FILLERS = [
+    'i', 'have', 'had', 'a', 'the', 'since', 'yesterday', 'for', 'two', 'days', 'and', 'with', 'my',
+    'mild', 'severe', 'at', 'night', 'after', 'eating', 'really', 'bad', 'it', 'hurts', 'feel', 'very',
+]
+
+
+def pseudo_word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def synthetic_knowledge_base(vocab_size, seed):
+    """The real knowledge base with made-up keywords added until it has vocab_size keywords"""
+    rng = random.Random(seed)
+    with open(DEFAULT_PATH, encoding='utf-8') as file:
+        data = json.load(file)
+    categories = [name for name in data['categories'] if name != 'general']
+    keywords = {keyword for name in categories for keyword in data['categories'][name]['keywords']}
+    while len(keywords) < vocab_size:
+        # One in four is a phrase, like the real 'shortness of breath'
+        keyword = ' '.join(pseudo_word(rng) for _ in range(rng.choice([1, 1, 1, 2, 3])))
+        if keyword not in keywords:
+            keywords.add(keyword)
+            data['categories'][rng.choice(categories)]['keywords'].append(keyword)
+    return data, sorted(keywords)
+
+
+def typo(word, rng):
+    """Drop, double or swap one letter"""
+    if len(word) < 6:
+        return word
+    index = rng.randrange(1, len(word) - 1)
+    return rng.choice([
+        word[:index] + word[index + 1:],
+        word[:index] + word[index] + word[index:],
+        word[:index - 1] + word[index] + word[index - 1] + word[index + 1:],
+    ])
+
+
+def sentence(keywords, length, rng, typo_rate=0.1):
+    """About `length` words: fillers with a keyword every few words"""
+    words = []
+    while len(words) < length:
+        if rng.random() < 0.3:
+            keyword = rng.choice(keywords).split()
+            words += [typo(word, rng) if rng.random() < typo_rate else word for word in keyword]
+        else:
+            words.append(rng.choice(FILLERS))
+    return ' '.join(words[:length])
+
+
+def percentiles(samples):
+    values = np.array(samples) * 1e6
+    return {f'p{p}': round(float(np.percentile(values, p)), 2) for p in (50, 90, 99)}
+
+
+def time_calls(texts):
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        SymptomChecker.analyze_symptoms(text, 30, 'F')
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def allocation_per_call(texts):
+    peaks = []
+    tracemalloc.start()
+    try:
+        for text in texts:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            SymptomChecker.analyze_symptoms(text, 30, 'F')
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return int(statistics.median(peaks))
+
+
+def threaded_throughput(texts, threads):
+    SymptomChecker.cache_clear()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda text: SymptomChecker.analyze_symptoms(text, 30, 'F'), texts, chunksize=64))
+        elapsed = time.perf_counter() - start
+    return round(len(texts) / elapsed, 1)
+
+
+def run(vocab_size, length, calls, threads, seed):
+    rng = random.Random(seed)
+    data, keywords = synthetic_knowledge_base(vocab_size, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'symptoms.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        with override_settings(SYMPTOM_KNOWLEDGE_BASE=path):
+            started = time.perf_counter()
+            reload_knowledge_base()
+            compile_ms = (time.perf_counter() - started) * 1000
+            assert len(get_knowledge_base().scorer.terms) == len(keywords)
+
+            # Distinct texts, so every call misses the cache
+            texts = list(dict.fromkeys(sentence(keywords, length, rng) for _ in range(calls * 2)))[:calls]
+            SymptomChecker.cache_clear()
+            uncached = time_calls(texts)
+            cached = time_calls(texts)
+            SymptomChecker.cache_clear()
+            allocated = allocation_per_call(texts[:200])
+            throughput = {str(count): threaded_throughput(texts, count) for count in threads}
+    reload_knowledge_base()
+
+    return {
+        'vocab_size': vocab_size,
+        'words_per_text': length,
+        'calls': len(texts),
+        'compile_ms': round(compile_ms, 2),
+        'uncached_us': percentiles(uncached),
+        'cached_us': percentiles(cached),
+        'alloc_peak_bytes': allocated,
+        'throughput_per_s': throughput,
+    }
+
+
+def compare(results, baseline_path):
+    """Print the relative change of each figure against an earlier run"""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {(row['vocab_size'], row['words_per_text']): row for row in json.load(file)['results']}
+    print(f'\nChange vs {baseline_path} (negative latency / positive throughput is better):')
+    for row in results:
+        before = baseline.get((row['vocab_size'], row['words_per_text']))
+        if before is None:
+            continue
+        changes = []
+        for group in ('uncached_us', 'cached_us', 'throughput_per_s'):
+            for key, value in row[group].items():
+                if before[group].get(key):
+                    changes.append(f'{group}.{key} {100 * (value / before[group][key] - 1):+.1f}%')
+        print(f"  vocab {row['vocab_size']}, {row['words_per_text']} words: " + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vocab', type=int, nargs='+', default=[100, 1000, 10000], help='Keywords in the knowledge base')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[5, 20, 80], help='Words per symptom text')
+    parser.add_argument('--calls', type=int, default=2000, help='Distinct texts per configuration')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='symptom_benchmark.json')
+    parser.add_argument('--baseline', help='Earlier --output file to compare against')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'vocab':>7} {'words':>6} {'p50 us':>9} {'p99 us':>9} {'cached p50':>11} {'alloc KiB':>10}  throughput/s by threads")
+    for vocab_size in args.vocab:
+        for length in args.lengths:
+            row = run(vocab_size, length, args.calls, args.threads, args.seed)
+            results.append(row)
+            print(
+                f"{vocab_size:>7} {length:>6} {row['uncached_us']['p50']:>9.1f} {row['uncached_us']['p99']:>9.1f} "
+                f"{row['cached_us']['p50']:>11.1f} {row['alloc_peak_bytes'] / 1024:>10.1f}  "
+                + ' '.join(f'{threads}:{rate:,.0f}' for threads, rate in row['throughput_per_s'].items())
+            )
+
+    report = {
+        'benchmark': 'symptom_checker',
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f'\nWrote {args.output}')
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -102,6 +102,30 @@ DATABASES = {
 if 'DATABASE_URL' in os.environ:
     DATABASES['default'] = dj_database_url.parse(os.environ['DATABASE_URL'])
 
+# SQLite tests use a file rather than the default in-memory database, so
+# threads get connections of their own (ConcurrentBookingTest)
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', str(BASE_DIR / 'test_db.sqlite3'))
+
+
+# Per-process memory cache by default. With several worker processes, a
+# shared backend (e.g. Redis) lets one process's invalidations reach the
+# others; see symptoms/routing.py for what is cached and for how long.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Nearby hospital search: 'memory' uses an in-process grid index,
+# 'database' pushes a bounding box into SQL (hospital_lat_lon_idx)
+HOSPITAL_NEARBY_BACKEND = os.environ.get('HOSPITAL_NEARBY_BACKEND', 'memory')
+
+# Symptom checker knowledge base (JSON); edits are picked up without a restart
+SYMPTOM_KNOWLEDGE_BASE = os.environ.get(
+    'SYMPTOM_KNOWLEDGE_BASE', str(BASE_DIR / 'symptoms' / 'data' / 'symptom_database.json')
+)
+
 
 # Password validation
 
@@ -162,6 +186,10 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_THROTTLE_RATES': {
+        # /api/symptoms/batch/ requests per account (up to MAX_SYMPTOM_BATCH records each)
+        'symptom_batch': os.environ.get('SYMPTOM_BATCH_RATE', '60/hour'),
+    },
 }
 
 # CORS settings
@@ -0,0 +1,214 @@
+"""
+Map marker clustering for hospitals
+
+Hospitals are grouped into square cells of the Web Mercator map at every
+zoom level. Each cell keeps running totals (count, coordinate sums,
+emergency count) so clusters can be updated one hospital at a time when
+a Hospital row changes, and a map view only reads the cells it shows.
+When the table version moves on (see versioning.py) only the rows saved
+since the last sync are re-read, plus the ids when rows were deleted.
+"""
+import math
+import threading
+from datetime import timedelta
+
+from .models import Hospital
+from .versioning import current_version, expire_version
+
+# Deepest zoom level with its own clusters; closer zooms reuse it
+MAX_CLUSTER_ZOOM = 16
+
+# Cluster cell size in screen pixels (map tiles are 256 px)
+CLUSTER_CELL_PX = 64
+
+# Web Mercator cannot show the poles
+MAX_MERCATOR_LAT = 85.05112878
+
+# Rows saved this long before the last one seen are re-read on sync, in
+# case their transaction committed after it
+SYNC_OVERLAP = timedelta(seconds=30)
+
+# Ids per query when loading rows the sync missed (SQLite allows 999 parameters)
+SYNC_BATCH_SIZE = 900
+
+CLUSTER_FIELDS = ('id', 'latitude', 'longitude', 'has_emergency')
+
+
+def project(lat, lon):
+    """Project a coordinate to Web Mercator (x, y), each in [0, 1)"""
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    x = (lon + 180) / 360
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+
+def cells_per_side(zoom):
+    """Number of cluster cells across the whole map at a zoom level"""
+    return (2 ** zoom) * 256 // CLUSTER_CELL_PX
+
+
+class Cluster:
+    """
+    Running totals for one cell. id_total is the sum of member ids, which
+    is the hospital id itself whenever the cluster holds one hospital.
+    """
+    __slots__ = ('count', 'lat_total', 'lon_total', 'emergency', 'id_total')
+
+    def __init__(self):
+        self.count = 0
+        self.lat_total = 0.0
+        self.lon_total = 0.0
+        self.emergency = 0
+        self.id_total = 0
+
+    def add(self, hospital_id, lat, lon, has_emergency, sign=1):
+        self.count += sign
+        self.lat_total += sign * lat
+        self.lon_total += sign * lon
+        self.emergency += sign * int(has_emergency)
+        self.id_total += sign * hospital_id
+
+    def as_list(self):
+        """[lat, lon, count, emergency_count, hospital_id or None]"""
+        return [
+            round(self.lat_total / self.count, 5),
+            round(self.lon_total / self.count, 5),
+            self.count,
+            self.emergency,
+            self.id_total if self.count == 1 else None,
+        ]
+
+
+class ClusterStore:
+    """Clusters for every zoom level from 0 to MAX_CLUSTER_ZOOM"""
+
+    def __init__(self, points=()):
+        self.levels = [{} for _ in range(MAX_CLUSTER_ZOOM + 1)]
+        self.hospitals = {}
+        # Every hospital id seen, with or without coordinates
+        self.row_ids = set()
+        self.version = None
+        self.lock = threading.Lock()
+        for hospital_id, lat, lon, has_emergency in points:
+            self.row_ids.add(hospital_id)
+            if lat is not None and lon is not None:
+                self._add(hospital_id, float(lat), float(lon), has_emergency)
+
+    @classmethod
+    def from_queryset(cls, queryset, version=None):
+        """Build clusters for every hospital with coordinates"""
+        store = cls(queryset.values_list(*CLUSTER_FIELDS).order_by())
+        store.version = version
+        return store
+
+    def sync(self, queryset, version):
+        """
+        Catch up with the table at `version` by re-reading only the rows
+        saved since the previous version, then the ids if the count is off
+        """
+        changed = queryset
+        previous_latest = self.version[1] if self.version else None
+        if previous_latest is not None:
+            changed = queryset.filter(updated_at__gte=previous_latest - SYNC_OVERLAP)
+        for hospital_id, lat, lon, has_emergency in changed.values_list(*CLUSTER_FIELDS).order_by():
+            self.row_ids.add(hospital_id)
+            self.move(hospital_id, lat, lon, has_emergency)
+
+        if len(self.row_ids) != version[0]:
+            # Rows were deleted, or inserted with an updated_at older than
+            # the overlap (a long COPY transaction stamps its start time)
+            current = set(queryset.values_list('id', flat=True).order_by())
+            for hospital_id in self.row_ids - current:
+                self.remove(hospital_id)
+            missing = list(current - self.row_ids)
+            for start in range(0, len(missing), SYNC_BATCH_SIZE):
+                rows = queryset.filter(pk__in=missing[start:start + SYNC_BATCH_SIZE])
+                for hospital_id, lat, lon, has_emergency in rows.values_list(*CLUSTER_FIELDS).order_by():
+                    self.move(hospital_id, lat, lon, has_emergency)
+            self.row_ids = current
+        self.version = version
+
+    def _cells(self, lat, lon):
+        x, y = project(lat, lon)
+        for zoom, level in enumerate(self.levels):
+            side = cells_per_side(zoom)
+            yield level, (int(x * side), int(y * side))
+
+    def _add(self, hospital_id, lat, lon, has_emergency):
+        self.hospitals[hospital_id] = (lat, lon, has_emergency)
+        for level, key in self._cells(lat, lon):
+            cluster = level.get(key)
+            if cluster is None:
+                cluster = level[key] = Cluster()
+            cluster.add(hospital_id, lat, lon, has_emergency)
+
+    def _remove(self, hospital_id):
+        previous = self.hospitals.pop(hospital_id, None)
+        if previous is None:
+            return
+        lat, lon, has_emergency = previous
+        for level, key in self._cells(lat, lon):
+            cluster = level[key]
+            cluster.add(hospital_id, lat, lon, has_emergency, sign=-1)
+            if cluster.count == 0:
+                del level[key]
+
+    def move(self, hospital_id, lat, lon, has_emergency):
+        """Move a hospital to the clusters of its current coordinates"""
+        with self.lock:
+            self._remove(hospital_id)
+            if lat is not None and lon is not None:
+                self._add(hospital_id, float(lat), float(lon), has_emergency)
+
+    def remove(self, hospital_id):
+        """Drop a deleted hospital from its clusters"""
+        with self.lock:
+            self._remove(hospital_id)
+
+    def clusters(self, zoom, south, west, north, east):
+        """Return the clusters at `zoom` whose cells overlap the bounding box"""
+        zoom = max(0, min(int(zoom), MAX_CLUSTER_ZOOM))
+        side = cells_per_side(zoom)
+        min_x, max_y = project(south, west)
+        max_x, min_y = project(north, east)
+        x_range = range(int(min_x * side), int(max_x * side) + 1)
+        y_range = range(int(min_y * side), int(max_y * side) + 1)
+
+        level = self.levels[zoom]
+        with self.lock:
+            if len(x_range) * len(y_range) > len(level):
+                cells = [cluster for (x, y), cluster in level.items() if x in x_range and y in y_range]
+            else:
+                cells = [level[(x, y)] for x in x_range for y in y_range if (x, y) in level]
+            return [cluster.as_list() for cluster in cells]
+
+
+_store = None
+_lock = threading.Lock()
+
+
+def get_cluster_store():
+    """
+    Return the process-wide cluster store, building it on first use or
+    after an invalidation, and syncing it once the Hospital table has
+    changed (see versioning.py)
+    """
+    global _store
+    version = current_version()
+    store = _store
+    if store is None or store.version != version:
+        with _lock:
+            store = _store
+            if store is None:
+                _store = store = ClusterStore.from_queryset(Hospital.objects.all(), version)
+            elif store.version != version:
+                store.sync(Hospital.objects.all(), version)
+    return store
+
+
+def invalidate_cluster_store():
+    """Drop all clusters so the next request rebuilds them (after bulk loads)"""
+    global _store
+    expire_version()
+    _store = None
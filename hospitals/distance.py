@@ -0,0 +1,79 @@
+"""
+Distance calculations for hospital search
+
+haversine_distance handles a single pair of points. DistanceEngine keeps
+hospital coordinates as contiguous float64 radian arrays and computes
+distances for whole candidate sets (or batches of query points) in one
+vectorized NumPy pass.
+"""
+import math
+
+import numpy as np
+
+# Radius of earth in kilometers
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points
+    on the earth (specified in decimal degrees)
+    Returns distance in kilometers
+    """
+    # Convert decimal degrees to radians
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+
+    return c * EARTH_RADIUS_KM
+
+
+class DistanceEngine:
+    """
+    Vectorized haversine over a fixed set of points.
+    Coordinates are given in decimal degrees and stored in radians,
+    with cos(latitude) precomputed since it does not depend on the query.
+    """
+
+    def __init__(self, ids, latitudes, longitudes):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.lat = np.radians(np.ascontiguousarray(latitudes, dtype=np.float64))
+        self.lon = np.radians(np.ascontiguousarray(longitudes, dtype=np.float64))
+        self.cos_lat = np.cos(self.lat)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, lat, lon, rows=None):
+        """
+        Distance in km from (lat, lon) to every stored point, or only to
+        the points at positions `rows` when given.
+        """
+        lat1 = math.radians(lat)
+        lon1 = math.radians(lon)
+        if rows is None:
+            lat2, lon2, cos_lat2 = self.lat, self.lon, self.cos_lat
+        else:
+            lat2, lon2, cos_lat2 = self.lat[rows], self.lon[rows], self.cos_lat[rows]
+
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * cos_lat2 * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def distance_matrix(self, latitudes, longitudes, rows=None):
+        """
+        Distance in km from a batch of query points (decimal degrees) to
+        the stored points. Returns an array of shape (queries, points).
+        """
+        lat1 = np.radians(np.asarray(latitudes, dtype=np.float64))[:, np.newaxis]
+        lon1 = np.radians(np.asarray(longitudes, dtype=np.float64))[:, np.newaxis]
+        if rows is None:
+            lat2, lon2, cos_lat2 = self.lat, self.lon, self.cos_lat
+        else:
+            lat2, lon2, cos_lat2 = self.lat[rows], self.lon[rows], self.cos_lat[rows]
+
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * cos_lat2 * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
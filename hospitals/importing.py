@@ -0,0 +1,337 @@
+"""
+Helpers for importing hospital data from CSV
+
+Shared by the import_hospitals management command: reading (optionally
+gzip-compressed) CSV files as a stream, turning rows into Hospital field
+values (see parsing.py), writing them in bulk and checkpointing progress
+so an interrupted import can resume.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .clustering import invalidate_cluster_store
+from .models import Hospital
+from .parsing import IMPORTED_FIELDS, parse_chunk, parse_range, parse_row, row_hash, unpack_row  # noqa: F401
+from .spatial import invalidate_hospital_index
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 20000
+
+# Names per query when looking up existing hospitals (SQLite allows 999 parameters)
+LOOKUP_BATCH_SIZE = 900
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Marks NULL in the CSV sent to PostgreSQL COPY (unquoted empty means '')
+COPY_NULL = '\\N'
+
+def is_gzip(path):
+    """Check the file's magic bytes rather than trusting its extension"""
+    with open(path, 'rb') as file:
+        return file.read(2) == GZIP_MAGIC
+
+
+def open_binary(path):
+    """Open a plain or gzip-compressed file for binary reading"""
+    return gzip.open(path, 'rb') if is_gzip(path) else open(path, 'rb')
+
+
+def open_text(path):
+    """Open a plain or gzip-compressed file as UTF-8 text"""
+    return gzip.open(path, 'rt', encoding='utf-8') if is_gzip(path) else open(path, 'r', encoding='utf-8')
+
+
+class CsvStream:
+    """
+    Iterate a CSV file as dict rows in constant memory.
+    `offset` is always the byte position just past the last row returned
+    (in the decompressed stream for gzip files), so reading can later
+    restart from it. Seeking in a gzip file re-reads it up to that point.
+    """
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.file = open_binary(path)
+        self.header = next(csv.reader([self.file.readline().decode('utf-8-sig')]))
+        self.offset = self.file.tell()
+        if offset > self.offset:
+            self.file.seek(offset)
+            self.offset = offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+    def _lines(self):
+        for line in self.file:
+            self.offset += len(line)
+            yield line.decode('utf-8')
+
+    def __iter__(self):
+        # csv.reader pulls exactly the lines of one record at a time, so
+        # offset stays in step even for quoted fields spanning lines
+        for values in csv.reader(self._lines()):
+            if values:
+                yield dict(zip(self.header, values))
+
+    def chunks(self, size):
+        """Yield (rows, offset) lists of up to `size` rows with the offset just past them"""
+        rows = []
+        for row in self:
+            rows.append(row)
+            if len(rows) >= size:
+                yield rows, self.offset
+                rows = []
+        if rows:
+            yield rows, self.offset
+
+    def ranges(self, size):
+        """
+        Yield (start, end, data) byte ranges of about `size` records each
+        for import_hospitals --workers, which decode and parse them (see
+        parsing.parse_range). Records are only delimited here: a line ends
+        one when it closes every quote opened since the record started.
+        `data` carries the bytes for gzip files, None for plain ones.
+        """
+        compressed = isinstance(self.file, gzip.GzipFile)
+        start, records, quotes, lines = self.offset, 0, 0, []
+        for line in self.file:
+            self.offset += len(line)
+            if compressed:
+                lines.append(line)
+            quotes += line.count(b'"')
+            if quotes % 2:
+                continue
+            quotes = 0
+            records += 1
+            if records >= size:
+                yield start, self.offset, b''.join(lines) if compressed else None
+                start, records, lines = self.offset, 0, []
+        if self.offset > start:
+            yield start, self.offset, b''.join(lines) if compressed else None
+
+
+class Checkpoint:
+    """
+    Progress of a chunked import, stored next to the CSV file as JSON.
+    The file's size and modification time are recorded so a checkpoint
+    is never applied to a different file.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.path = f'{csv_path}.checkpoint'
+
+    def fingerprint(self):
+        stat = os.stat(self.csv_path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def load(self):
+        """Return the saved state, or None if there is no usable checkpoint"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if state.get('file') != self.fingerprint():
+            return None
+        return state
+
+    def save(self, state):
+        """Write the checkpoint atomically so a crash never leaves half a file"""
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(dict(state, file=self.fingerprint()), file)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def existing_keys(names):
+    """Return the (name, state) pairs already stored for the given names"""
+    names = list(set(names))
+    keys = set()
+    for start in range(0, len(names), LOOKUP_BATCH_SIZE):
+        keys.update(
+            Hospital.objects.filter(name__in=names[start:start + LOOKUP_BATCH_SIZE])
+            .values_list('name', 'state').order_by()
+        )
+    return keys
+
+
+def insert_new(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Insert parsed rows whose (name, state) is not stored yet, in one
+    transaction. Returns (inserted, skipped).
+    On PostgreSQL the rows go through COPY; elsewhere through bulk_create.
+    Signals are not sent; call refresh_derived_data() once loading ends.
+    """
+    if not rows:
+        return 0, 0
+    if connection.vendor == 'postgresql':
+        return copy_insert_new(rows)
+    return orm_insert_new(rows, batch_size)
+
+
+def orm_insert_new(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Batched bulk_create of the rows whose (name, state) is new"""
+    with transaction.atomic():
+        known = existing_keys(fields['name'] for fields in rows)
+        hospitals = []
+        for fields in rows:
+            key = (fields['name'], fields['state'])
+            if key in known:
+                continue
+            # Also catches duplicates within the chunk itself
+            known.add(key)
+            hospitals.append(Hospital(**fields))
+
+        Hospital.objects.bulk_create(hospitals, batch_size=batch_size)
+    return len(hospitals), len(rows) - len(hospitals)
+
+
+def copy_buffer(rows):
+    """
+    Render parsed rows as CSV for COPY: one line per row with the
+    IMPORTED_FIELDS, row_hash and the row's position in the chunk.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for position, fields in enumerate(rows):
+        values = []
+        for name in IMPORTED_FIELDS + ('row_hash',):
+            value = fields[name]
+            if value is None:
+                value = COPY_NULL
+            elif isinstance(value, bool):
+                value = 't' if value else 'f'
+            values.append(value)
+        values.append(position)
+        writer.writerow(values)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_insert_new(rows):
+    """
+    PostgreSQL fast path: COPY the chunk into a temporary staging table,
+    then merge it into the hospital table with one INSERT ... SELECT that
+    skips (name, state) pairs already stored and duplicates in the chunk.
+    """
+    quote = connection.ops.quote_name
+    meta = Hospital._meta
+    table = quote(meta.db_table)
+    staged = [meta.get_field(name).column for name in IMPORTED_FIELDS + ('row_hash',)]
+    staged_sql = ', '.join(quote(column) for column in staged)
+
+    # Columns not in the CSV get their model defaults (timestamps: now)
+    extra_columns, extra_values, params = [], [], []
+    for field in meta.concrete_fields:
+        if field.primary_key or field.column in staged:
+            continue
+        extra_columns.append(quote(field.column))
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            extra_values.append('NOW()')
+        else:
+            extra_values.append('%s')
+            params.append(field.get_db_prep_save(field.get_default(), connection))
+
+    name, state = quote(meta.get_field('name').column), quote(meta.get_field('state').column)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # ON COMMIT DROP does not fire when this block is only a savepoint
+        # in an outer transaction, so a previous chunk's table may remain
+        cursor.execute('DROP TABLE IF EXISTS hospital_import_stage')
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE hospital_import_stage ON COMMIT DROP AS '
+            f'SELECT {staged_sql} FROM {table} WITH NO DATA'
+        )
+        cursor.execute('ALTER TABLE hospital_import_stage ADD COLUMN position integer')
+
+        copy_sql = (
+            f'COPY hospital_import_stage ({staged_sql}, position) '
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+        )
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):
+            # psycopg2
+            raw_cursor.copy_expert(copy_sql, copy_buffer(rows))
+        else:
+            # psycopg 3
+            with raw_cursor.copy(copy_sql) as copy:
+                copy.write(copy_buffer(rows).getvalue())
+
+        selected = ', '.join(f'stage.{quote(column)}' for column in staged)
+        cursor.execute(
+            f'INSERT INTO {table} ({staged_sql}, {", ".join(extra_columns)}) '
+            f'SELECT DISTINCT ON (stage.{name}, stage.{state}) {selected}, {", ".join(extra_values)} '
+            f'FROM hospital_import_stage stage '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {table} existing '
+            f'WHERE existing.{name} = stage.{name} AND existing.{state} = stage.{state}) '
+            f'ORDER BY stage.{name}, stage.{state}, stage.position',
+            params,
+        )
+        inserted = cursor.rowcount
+        cursor.execute('DROP TABLE hospital_import_stage')
+    return inserted, len(rows) - inserted
+
+
+def stored_hashes():
+    """Return {(name, state): (id, row_hash)} for every stored hospital"""
+    return {
+        (name, state): (pk, stored_hash)
+        for pk, name, state, stored_hash in
+        Hospital.objects.values_list('id', 'name', 'state', 'row_hash').order_by()
+    }
+
+
+def apply_diff(inserted, changed, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Insert new rows and update changed ones (rows carrying an 'id') in one
+    transaction. Returns the saved Hospital instances.
+    """
+    now = timezone.now()
+    new_hospitals = [Hospital(**fields) for fields in inserted]
+    changed_hospitals = [Hospital(updated_at=now, **fields) for fields in changed]
+
+    with transaction.atomic():
+        Hospital.objects.bulk_create(new_hospitals, batch_size=batch_size)
+        Hospital.objects.bulk_update(
+            changed_hospitals, IMPORTED_FIELDS + ('row_hash', 'updated_at'), batch_size=batch_size
+        )
+    return new_hospitals + changed_hospitals
+
+
+def delete_hospitals(hospital_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Delete hospitals by id in batches inside one transaction"""
+    with transaction.atomic():
+        for start in range(0, len(hospital_ids), batch_size):
+            Hospital.objects.filter(pk__in=hospital_ids[start:start + batch_size]).delete()
+
+
+def refresh_changed(saved, deleted_ids):
+    """
+    Bring in-memory structures up to date after a diff import without
+    rebuilding map clusters from scratch: they sync only the rows saved
+    since their version (other processes notice the new table version
+    themselves, see versioning.py)
+    """
+    if saved or deleted_ids:
+        invalidate_hospital_index()
+
+
+def refresh_derived_data():
+    """Rebuild in-memory structures derived from the Hospital table"""
+    invalidate_hospital_index()
+    invalidate_cluster_store()
@@ -1,11 +1,22 @@
 """
 Management command to import real Indian hospital data from CSV
+(plain or gzip-compressed)
 """
 import csv
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from django.core.management.base import BaseCommand
+from hospitals.importing import (
+    DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE, Checkpoint, CsvStream, apply_diff,
+    delete_hospitals, insert_new, open_text, parse_chunk, parse_range, parse_row, refresh_changed,
+    refresh_derived_data, stored_hashes, unpack_row,
+)
 from hospitals.models import Hospital
-from decimal import Decimal
+
+# Parsed chunks allowed to wait for the database writer, per --workers process
+PENDING_PER_WORKER = 2
 
 
 class Command(BaseCommand):
@@ -23,6 +34,44 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing hospital data before importing'
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Stream the file and insert new hospitals set-based (COPY on PostgreSQL, bulk_create elsewhere), committing one chunk at a time'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Rows per INSERT in --bulk mode (default: {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Rows per committed transaction and checkpoint in --bulk mode (default: {DEFAULT_CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted --bulk import from its last committed chunk (implies --bulk)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Parse and validate chunks in N processes feeding one database writer (implies --bulk)'
+        )
+        parser.add_argument(
+            '--diff',
+            action='store_true',
+            help='Refresh: insert new and update changed hospitals, leaving unchanged rows alone'
+        )
+        parser.add_argument(
+            '--delete-missing',
+            action='store_true',
+            help='With --diff, also delete stored hospitals that are missing from the file'
+        )
 
     def handle(self, *args, **options):
         csv_file = options['file']
@@ -33,70 +82,244 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f'File not found: {csv_file}'))
             return
 
-        # Clear existing data if requested
-        if clear_data:
+        if options['diff']:
+            if clear_data or options['resume']:
+                self.stdout.write(self.style.ERROR('--diff cannot be combined with --clear or --resume'))
+                return
+            self.diff_import(csv_file, options['batch_size'], options['chunk_size'], options['delete_missing'])
+            return
+
+        if options['delete_missing']:
+            self.stdout.write(self.style.ERROR('--delete-missing requires --diff'))
+            return
+
+        if options['workers'] < 1:
+            self.stdout.write(self.style.ERROR('--workers must be at least 1'))
+            return
+
+        checkpoint = Checkpoint(csv_file)
+        state = checkpoint.load() if options['resume'] else None
+        if options['resume'] and state is None:
+            self.stdout.write(self.style.WARNING('No checkpoint found for this file, starting from the beginning'))
+
+        # Clear existing data if requested (a resumed run already did)
+        if clear_data and state is None:
             count = Hospital.objects.count()
             Hospital.objects.all().delete()
             self.stdout.write(self.style.WARNING(f'Deleted {count} existing hospitals'))
 
-        # Import data
+        self.stdout.write(self.style.NOTICE(f'Importing hospitals from {csv_file}...'))
+        started = time.perf_counter()
+
+        try:
+            if options['bulk'] or options['resume'] or options['workers'] > 1:
+                imported_count, skipped_count = self.import_bulk(
+                    csv_file, options['batch_size'], options['chunk_size'], checkpoint, state, options['workers']
+                )
+            else:
+                imported_count, skipped_count = self.import_rows(csv_file)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error reading CSV file: {str(e)}'))
+            return
+
+        elapsed = time.perf_counter() - started
+        rate = (imported_count + skipped_count) / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nImport complete!'
+                f'\n✓ Imported: {imported_count} hospitals'
+                f'\n✗ Skipped: {skipped_count} hospitals'
+                f'\n⏱ {elapsed:.2f}s ({rate:,.0f} rows/second)'
+                f'\n📊 Total in database: {Hospital.objects.count()} hospitals'
+            )
+        )
+
+    def report_error(self, row, error):
+        self.stdout.write(
+            self.style.ERROR(f'Error importing {row.get("facility_name", "Unknown")}: {str(error)}')
+        )
+
+    def import_rows(self, csv_file):
+        """Import one row at a time (one existence check and one INSERT per row)"""
         imported_count = 0
         skipped_count = 0
-        
-        self.stdout.write(self.style.NOTICE(f'Importing hospitals from {csv_file}...'))
+
+        with open_text(csv_file) as file:
+            reader = csv.DictReader(file)
+
+            for row in reader:
+                try:
+                    fields = parse_row(row)
+
+                    # Check if hospital already exists (by name and state)
+                    if Hospital.objects.filter(name=fields['name'], state=fields['state']).exists():
+                        skipped_count += 1
+                        continue
+
+                    Hospital.objects.create(**fields)
+                    imported_count += 1
+
+                except Exception as e:
+                    self.report_error(row, e)
+                    skipped_count += 1
+                    continue
+
+        return imported_count, skipped_count
+
+    def import_bulk(self, csv_file, batch_size, chunk_size, checkpoint, state=None, workers=1):
+        """
+        Stream the file in constant memory and insert new hospitals in one
+        set-based step per chunk (COPY + merge on PostgreSQL, bulk_create
+        elsewhere), one transaction per chunk. After every committed chunk
+        the byte offset is checkpointed so an interrupted run can --resume.
+
+        With workers > 1, this process only splits the file into byte
+        ranges; a process pool reads, decodes and parses them while this
+        process stays the only database writer. At most PENDING_PER_WORKER
+        chunks per worker are in flight, so memory stays bounded when
+        parsing outpaces the database.
+        """
+        if state is None:
+            state = {'offset': 0, 'rows': 0, 'imported': 0, 'skipped': 0}
+        else:
+            self.stdout.write(self.style.NOTICE(
+                f'Resuming after row {state["rows"]} (byte {state["offset"]})'
+            ))
 
         try:
-            with open(csv_file, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                
-                for row in reader:
+            with CsvStream(csv_file, state['offset']) as stream:
+                if workers > 1:
+                    self.parse_in_pool(stream, chunk_size, workers, batch_size, checkpoint, state)
+                else:
+                    for rows, offset in stream.chunks(chunk_size):
+                        self.commit_chunk(parse_chunk(rows), len(rows), offset, batch_size, checkpoint, state)
+        finally:
+            refresh_derived_data()
+
+        checkpoint.clear()
+        return state['imported'], state['skipped']
+
+    def parse_in_pool(self, stream, chunk_size, workers, batch_size, checkpoint, state):
+        """
+        Have worker processes read, decode and parse byte ranges of the
+        file, and commit their results in file order
+        """
+        pending = deque()
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            for start, end, data in stream.ranges(chunk_size):
+                if len(pending) >= workers * PENDING_PER_WORKER:
+                    self.commit_chunk(*self.next_parsed(pending), batch_size, checkpoint, state)
+                future = executor.submit(parse_range, stream.path, stream.header, start, end, data)
+                pending.append((future, end))
+            while pending:
+                self.commit_chunk(*self.next_parsed(pending), batch_size, checkpoint, state)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def next_parsed(self, pending):
+        future, offset = pending.popleft()
+        packed, errors, error_count, row_count = future.result()
+        return ([unpack_row(values) for values in packed], errors, error_count), row_count, offset
+
+    def commit_chunk(self, parsed, row_count, offset, batch_size, checkpoint, state):
+        """Insert one parsed chunk, then record how far the file has been committed"""
+        chunk, errors, error_count = parsed
+        first_row = state['rows'] + 1
+        state['rows'] += row_count
+        if error_count:
+            self.report_chunk_errors(first_row, state['rows'], errors, error_count)
+
+        imported, skipped = insert_new(chunk, batch_size)
+        state['imported'] += imported
+        state['skipped'] += skipped + error_count
+        state['offset'] = offset
+        checkpoint.save(state)
+        self.stdout.write(f'  committed {state["rows"]} rows ({state["imported"]} imported)')
+
+    def report_chunk_errors(self, first_row, last_row, errors, error_count):
+        """One summary per chunk instead of one line per rejected row"""
+        listed = '; '.join(f'{name}: {message}' for name, message in errors)
+        more = f' (+{error_count - len(errors)} more)' if error_count > len(errors) else ''
+        self.stdout.write(self.style.ERROR(
+            f'Rows {first_row}-{last_row}: {error_count} rejected - {listed}{more}'
+        ))
+
+    def diff_import(self, csv_file, batch_size, chunk_size, delete_missing=False):
+        """
+        Compare each row's hash with the stored one and write only what
+        changed: new hospitals are inserted and changed ones updated in
+        bulk. Hospitals missing from the file are only deleted with
+        delete_missing, so a partial file cannot wipe the table.
+        """
+        self.stdout.write(self.style.NOTICE(f'Comparing {csv_file} with stored hospitals...'))
+        started = time.perf_counter()
+
+        stored = stored_hashes()
+        seen = set()
+        inserted, changed = [], []
+        saved = []
+        counts = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+
+        try:
+            with CsvStream(csv_file) as stream:
+                for row in stream:
+                    counts['rows'] += 1
                     try:
-                        # Check if hospital already exists (by name and state)
-                        if Hospital.objects.filter(
-                            name=row['facility_name'].strip(),
-                            state=row['state_name'].strip()
-                        ).exists():
-                            skipped_count += 1
-                            continue
-
-                        # Parse has_emergency
-                        has_emergency = row.get('has_emergency', 'False').strip().lower() in ['true', '1', 'yes']
-                        
-                        # Create hospital
-                        Hospital.objects.create(
-                            name=row['facility_name'].strip(),
-                            state=row['state_name'].strip(),
-                            district=row['district_name'].strip(),
-                            address=row.get('address', '').strip(),
-                            facility_type=row.get('facility_type', '').strip(),
-                            latitude=Decimal(row['latitude'].strip()) if row.get('latitude') else None,
-                            longitude=Decimal(row['longitude'].strip()) if row.get('longitude') else None,
-                            contact_number=row.get('contact', '').strip(),
-                            has_emergency=has_emergency,
-                            # Set some defaults for real hospitals
-                            has_ambulance=has_emergency,  # Assume emergency hospitals have ambulances
-                            beds_available=100 if 'Tertiary' in row.get('facility_type', '') else 50,
-                            rating=Decimal('4.0')
-                        )
-                        
-                        imported_count += 1
-                        
+                        fields = parse_row(row)
                     except Exception as e:
-                        self.stdout.write(
-                            self.style.ERROR(f'Error importing {row.get("facility_name", "Unknown")}: {str(e)}')
-                        )
-                        skipped_count += 1
+                        self.report_error(row, e)
+                        counts['skipped'] += 1
+                        # A malformed row must not cause its hospital to be deleted
+                        seen.add(((row.get('facility_name') or '').strip(), (row.get('state_name') or '').strip()))
                         continue
 
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'\nImport complete!'
-                    f'\n✓ Imported: {imported_count} hospitals'
-                    f'\n✗ Skipped: {skipped_count} hospitals'
-                    f'\n📊 Total in database: {Hospital.objects.count()} hospitals'
-                )
-            )
+                    key = (fields['name'], fields['state'])
+                    if key in seen:
+                        # Duplicate within the file, the first row wins
+                        counts['skipped'] += 1
+                        continue
+                    seen.add(key)
+
+                    current = stored.get(key)
+                    if current is None:
+                        inserted.append(fields)
+                    elif current[1] != fields['row_hash']:
+                        changed.append(dict(fields, id=current[0]))
+                    else:
+                        counts['unchanged'] += 1
+
+                    if len(inserted) + len(changed) >= chunk_size:
+                        saved += apply_diff(inserted, changed, batch_size)
+                        counts['inserted'] += len(inserted)
+                        counts['updated'] += len(changed)
+                        inserted, changed = [], []
 
+            saved += apply_diff(inserted, changed, batch_size)
+            counts['inserted'] += len(inserted)
+            counts['updated'] += len(changed)
         except Exception as e:
+            refresh_derived_data()
             self.stdout.write(self.style.ERROR(f'Error reading CSV file: {str(e)}'))
             return
+
+        missing = [pk for key, (pk, _) in stored.items() if key not in seen]
+        removed = missing if delete_missing else []
+        delete_hospitals(removed, batch_size)
+        refresh_changed(saved, removed)
+        kept = '' if delete_missing else f' ({len(missing)} missing from the file kept, see --delete-missing)'
+
+        elapsed = time.perf_counter() - started
+        rate = counts['rows'] / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nRefresh complete!'
+                f'\n+ Inserted: {counts["inserted"]} hospitals'
+                f'\n~ Updated: {counts["updated"]} hospitals'
+                f'\n- Removed: {len(removed)} hospitals{kept}'
+                f'\n= Unchanged: {counts["unchanged"]} hospitals'
+                f'\n✗ Skipped: {counts["skipped"]} rows'
+                f'\n⏱ {elapsed:.2f}s ({rate:,.0f} rows/second)'
+                f'\n📊 Total in database: {Hospital.objects.count()} hospitals'
+            )
+        )
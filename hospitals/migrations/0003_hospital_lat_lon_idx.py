@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0002_hospital_district_hospital_facility_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hospital',
+            index=models.Index(fields=['latitude', 'longitude'], name='hospital_lat_lon_idx'),
+        ),
+    ]
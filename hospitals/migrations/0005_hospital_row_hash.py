@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:21
+
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Frozen copy of hospitals.parsing at the time of this migration, so later
+# changes there cannot alter what it does
+IMPORTED_FIELDS = (
+    'name', 'state', 'district', 'address', 'facility_type', 'latitude', 'longitude',
+    'contact_number', 'has_emergency', 'has_ambulance', 'beds_available', 'rating',
+)
+BATCH_SIZE = 1000
+
+
+def row_hash(fields):
+    values = []
+    for name in IMPORTED_FIELDS:
+        value = fields[name]
+        if isinstance(value, Decimal):
+            value = f'{value:.6f}'
+        values.append('' if value is None else str(value))
+    return hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+
+
+def backfill_row_hashes(apps, schema_editor):
+    """
+    Hash the stored hospitals, so the first import_hospitals --diff only
+    rewrites rows that really differ (updated_at is left alone)
+    """
+    Hospital = apps.get_model('hospitals', 'Hospital')
+    batch = []
+    for fields in Hospital.objects.values('id', *IMPORTED_FIELDS).order_by().iterator(chunk_size=BATCH_SIZE):
+        batch.append(Hospital(id=fields['id'], row_hash=row_hash(fields)))
+        if len(batch) >= BATCH_SIZE:
+            Hospital.objects.bulk_update(batch, ['row_hash'])
+            batch = []
+    Hospital.objects.bulk_update(batch, ['row_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0004_hospital_name_state_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Hash of the imported CSV fields, used by import_hospitals --diff', max_length=40),
+        ),
+        migrations.RunPython(backfill_row_hashes, migrations.RunPython.noop),
+    ]
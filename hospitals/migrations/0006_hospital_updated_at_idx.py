@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0005_hospital_row_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hospital',
+            index=models.Index(fields=['updated_at'], name='hospital_updated_at_idx'),
+        ),
+    ]
@@ -24,11 +24,20 @@ class Hospital(models.Model):
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=4.0)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    row_hash = models.CharField(max_length=40, blank=True, default='', editable=False, help_text="Hash of the imported CSV fields, used by import_hospitals --diff")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-has_emergency', 'name']
+        indexes = [
+            # Backs the bounding-box prefilter of the nearby search
+            models.Index(fields=['latitude', 'longitude'], name='hospital_lat_lon_idx'),
+            # Duplicate check of the CSV import
+            models.Index(fields=['name', 'state'], name='hospital_name_state_idx'),
+            # Latest change for the table version checks (versioning.py)
+            models.Index(fields=['updated_at'], name='hospital_updated_at_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.city}"
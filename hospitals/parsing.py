@@ -0,0 +1,132 @@
+"""
+Turning hospital CSV rows into Hospital field values
+
+Kept free of Django imports so import_hospitals --workers can run it in
+worker processes, whatever multiprocessing start method is in use.
+Workers read and decode their own byte range of the file and send back
+compact tuples (PACKED_FIELDS, decimals as strings) rather than dicts.
+"""
+import csv
+import hashlib
+import io
+from decimal import Decimal
+
+# Rejected rows listed by name in a chunk's error report; the rest are counted
+MAX_REPORTED_ERRORS = 5
+
+# Hospital.latitude / longitude store 6 decimal places
+COORDINATE_PLACES = Decimal('0.000001')
+
+# Fields written by parse_row, in the order they are hashed
+IMPORTED_FIELDS = (
+    'name', 'state', 'district', 'address', 'facility_type', 'latitude', 'longitude',
+    'contact_number', 'has_emergency', 'has_ambulance', 'beds_available', 'rating',
+)
+
+# Order of the values in a packed row
+PACKED_FIELDS = IMPORTED_FIELDS + ('row_hash',)
+
+
+def parse_coordinate(value, limit, name):
+    """
+    A latitude (limit 90) or longitude (limit 180) from a CSV value,
+    rounded to the stored precision; None when empty
+    """
+    value = value.strip() if value else ''
+    if not value:
+        return None
+    coordinate = Decimal(value)
+    if not coordinate.is_finite() or not -limit <= coordinate <= limit:
+        raise ValueError(f'{name} {value} is outside -{limit}..{limit}')
+    return coordinate.quantize(COORDINATE_PLACES)
+
+
+def parse_row(row):
+    """
+    Convert one CSV row into a dict of Hospital field values.
+    Raises KeyError / ValueError / decimal.InvalidOperation on bad rows,
+    so they are rejected here rather than by the database.
+    """
+    # Parse has_emergency
+    has_emergency = row.get('has_emergency', 'False').strip().lower() in ['true', '1', 'yes']
+    facility_type = row.get('facility_type', '').strip()
+
+    fields = {
+        'name': row['facility_name'].strip(),
+        'state': row['state_name'].strip(),
+        'district': row['district_name'].strip(),
+        'address': row.get('address', '').strip(),
+        'facility_type': facility_type,
+        'latitude': parse_coordinate(row.get('latitude'), 90, 'latitude'),
+        'longitude': parse_coordinate(row.get('longitude'), 180, 'longitude'),
+        'contact_number': row.get('contact', '').strip(),
+        'has_emergency': has_emergency,
+        # Set some defaults for real hospitals
+        'has_ambulance': has_emergency,  # Assume emergency hospitals have ambulances
+        'beds_available': 100 if 'Tertiary' in facility_type else 50,
+        'rating': Decimal('4.0'),
+    }
+    fields['row_hash'] = row_hash(fields)
+    return fields
+
+
+def row_hash(fields):
+    """
+    Hash of the normalized imported values, so a later import can tell
+    whether a stored hospital changed without comparing every column.
+    Decimals are normalized to the stored precision (6 places).
+    """
+    values = []
+    for name in IMPORTED_FIELDS:
+        value = fields[name]
+        if isinstance(value, Decimal):
+            value = f'{value:.6f}'
+        values.append('' if value is None else str(value))
+    return hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+
+
+def parse_chunk(rows):
+    """
+    Parse a list of CSV rows. Returns (parsed, errors, error_count), where
+    errors holds up to MAX_REPORTED_ERRORS (facility name, message) pairs.
+    """
+    parsed, errors, error_count = [], [], 0
+    for row in rows:
+        try:
+            parsed.append(parse_row(row))
+        except Exception as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append((row.get('facility_name') or 'Unknown', str(e)))
+    return parsed, errors, error_count
+
+
+def pack_row(fields):
+    """Parsed fields as a tuple in PACKED_FIELDS order, decimals as strings"""
+    return tuple(str(value) if isinstance(value, Decimal) else value
+                 for value in (fields[name] for name in PACKED_FIELDS))
+
+
+def unpack_row(values):
+    """Field dict of a packed row (Hospital decimal fields accept the strings)"""
+    return dict(zip(PACKED_FIELDS, values))
+
+
+def parse_range(path, header, start, end, data=None):
+    """
+    Parse the CSV records between two byte offsets of a plain file, read
+    here in the worker; `data` holds the bytes instead when the file
+    cannot be seeked cheaply (gzip). Returns (packed rows, errors,
+    error_count, row_count) with errors as in parse_chunk().
+    """
+    if data is None:
+        with open(path, 'rb') as file:
+            file.seek(start)
+            data = file.read(end - start)
+    rows = [
+        dict(zip(header, values))
+        for values in csv.reader(line.decode('utf-8') for line in io.BytesIO(data))
+        if values
+    ]
+    parsed, errors, error_count = parse_chunk(rows)
+    return [pack_row(fields) for fields in parsed], errors, error_count, len(rows)
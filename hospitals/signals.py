@@ -0,0 +1,24 @@
+"""
+Signal handlers for Hospital Management
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Hospital
+from .spatial import invalidate_hospital_index, warm_emergency_index
+
+
+def hospitals_committed():
+    """
+    Rebuild the nearby-search indexes and have the map clusters sync.
+    Run after commit: a rebuild before it would cache the old rows.
+    """
+    invalidate_hospital_index()
+    warm_emergency_index()
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+def hospital_changed(sender, instance, **kwargs):
+    """Refresh the in-memory hospital structures once the change is committed"""
+    transaction.on_commit(hospitals_committed)
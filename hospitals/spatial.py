@@ -0,0 +1,473 @@
+"""
+Spatial index for hospital lookups
+
+Buckets hospital coordinates into a fixed-degree grid so that a nearby
+search only looks at the grid cells that intersect the search radius
+instead of every hospital in the table.
+"""
+import heapq
+import math
+import threading
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+
+import numpy as np
+from django.conf import settings
+
+from .distance import EARTH_RADIUS_KM, DistanceEngine
+from .models import Hospital
+from .versioning import current_version, expire_version
+
+# Emergency hospitals shown for severe symptoms and on the emergency page
+EMERGENCY_RESULTS = 5
+
+# Grid cell size in degrees (0.5 degree is roughly 55 km north-south)
+CELL_SIZE_DEGREES = 0.5
+
+# Columns returned by the nearby search
+NEARBY_FIELDS = (
+    'id', 'name', 'address', 'city', 'state', 'contact_number',
+    'has_emergency', 'has_ambulance', 'beds_available', 'rating',
+    'latitude', 'longitude',
+)
+
+# Hospitals fetched per query when loading rows by id
+FETCH_BATCH_SIZE = 500
+
+# Same precision as Hospital.latitude / Hospital.longitude
+COORDINATE_STEP = Decimal('0.000001')
+
+# First radius tried by the expanding database k-nearest search
+INITIAL_SEARCH_RADIUS_KM = 25
+
+# Half the earth's circumference: every point is within this distance
+MAX_SEARCH_RADIUS_KM = math.pi * EARTH_RADIUS_KM
+
+
+def parse_coordinates(lat, lon):
+    """(lat, lon) as floats from request values, or None if missing or invalid"""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    Return (min_lat, max_lat, min_lon, max_lon) in degrees enclosing every
+    point within radius_km of (lat, lon).
+    The longitude range widens to the whole globe when the circle reaches
+    a pole or crosses the antimeridian.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    lat_rad = math.radians(lat)
+    min_lat = lat_rad - angular
+    max_lat = lat_rad + angular
+
+    if min_lat > -math.pi / 2 and max_lat < math.pi / 2:
+        dlon = math.asin(min(1.0, math.sin(angular) / math.cos(lat_rad)))
+        min_lon = math.radians(lon) - dlon
+        max_lon = math.radians(lon) + dlon
+        if min_lon < -math.pi or max_lon > math.pi:
+            min_lon, max_lon = -math.pi, math.pi
+    else:
+        # A pole is inside the circle
+        min_lat = max(min_lat, -math.pi / 2)
+        max_lat = min(max_lat, math.pi / 2)
+        min_lon, max_lon = -math.pi, math.pi
+
+    return (
+        math.degrees(min_lat), math.degrees(max_lat),
+        math.degrees(min_lon), math.degrees(max_lon),
+    )
+
+
+def push_bounded(heap, k, distances, ids):
+    """
+    Merge (distance, id) candidates into a max-heap that keeps the k
+    nearest seen so far. The heap stores (-distance, -id) so the farthest
+    kept candidate sits at heap[0] and ties are broken by lowest id.
+    """
+    if len(distances) > k:
+        # Anything beyond the k-th nearest of this batch can never be kept
+        keep = np.argpartition(distances, k - 1)[:k]
+        distances, ids = distances[keep], ids[keep]
+
+    for distance, hospital_id in zip(distances.tolist(), ids.tolist()):
+        item = (-distance, -hospital_id)
+        if len(heap) < k:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+
+def sorted_heap(heap):
+    """Return a push_bounded heap as (distance, id) pairs, nearest first"""
+    return sorted((-distance, -hospital_id) for distance, hospital_id in heap)
+
+
+def bounding_box_filter(lat, lon, radius_km):
+    """
+    Return filter kwargs restricting Hospital rows to the bounding box of
+    the search radius, rounded outwards to the stored coordinate precision.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    return {
+        'latitude__range': (
+            Decimal(min_lat).quantize(COORDINATE_STEP, rounding=ROUND_FLOOR),
+            Decimal(max_lat).quantize(COORDINATE_STEP, rounding=ROUND_CEILING),
+        ),
+        'longitude__range': (
+            Decimal(min_lon).quantize(COORDINATE_STEP, rounding=ROUND_FLOOR),
+            Decimal(max_lon).quantize(COORDINATE_STEP, rounding=ROUND_CEILING),
+        ),
+    }
+
+
+class GridIndex:
+    """
+    Fixed-degree grid over hospital coordinates.
+    Points are sorted by cell and kept in a DistanceEngine, so every cell
+    is a contiguous (start, stop) slice of the engine's arrays.
+    """
+
+    def __init__(self, ids, latitudes, longitudes, cell_size=CELL_SIZE_DEGREES):
+        self.cell_size = cell_size
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        rows = np.floor(latitudes / cell_size).astype(np.int64)
+        cols = np.floor(longitudes / cell_size).astype(np.int64)
+
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        self.engine = DistanceEngine(np.asarray(ids, dtype=np.int64)[order], latitudes[order], longitudes[order])
+        self.size = len(self.engine)
+        # Hospital table version the index was built from (see versioning.py)
+        self.version = None
+
+        self.cells = {}
+        if self.size:
+            boundaries = np.flatnonzero((np.diff(rows) != 0) | (np.diff(cols) != 0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            stops = np.concatenate((boundaries, [self.size]))
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                self.cells[(int(rows[start]), int(cols[start]))] = (start, stop)
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        """Build an index from a Hospital queryset"""
+        rows = queryset.exclude(latitude__isnull=True).exclude(longitude__isnull=True) \
+            .values_list('id', 'latitude', 'longitude').order_by()
+        ids, latitudes, longitudes = [], [], []
+        for pk, lat, lon in rows:
+            ids.append(pk)
+            latitudes.append(float(lat))
+            longitudes.append(float(lon))
+        return cls(ids, latitudes, longitudes)
+
+    def cell_for(self, lat, lon):
+        """Return the (row, col) grid cell containing a coordinate"""
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def cells_in_box(self, min_lat, max_lat, min_lon, max_lon):
+        """Yield (start, stop) slices of the non-empty cells overlapping a bounding box"""
+        min_row, min_col = self.cell_for(min_lat, min_lon)
+        max_row, max_col = self.cell_for(max_lat, max_lon)
+
+        # Large boxes cover more grid positions than there are occupied
+        # cells, so walk the occupied cells instead
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            for (row, col), span in self.cells.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    yield span
+            return
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                span = self.cells.get((row, col))
+                if span:
+                    yield span
+
+    def candidate_rows(self, spans):
+        """Turn cell slices into one array of engine row positions"""
+        spans = list(spans)
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, stop) for start, stop in spans])
+
+    def within_radius(self, lat, lon, radius_km):
+        """
+        Return a list of (distance_km, hospital_id) for every indexed
+        hospital within radius_km of (lat, lon), nearest first.
+        """
+        rows = self.candidate_rows(self.cells_in_box(*bounding_box(lat, lon, radius_km)))
+        distances = self.engine.distances(lat, lon, rows)
+        inside = distances <= radius_km
+        rows, distances = rows[inside], distances[inside]
+
+        order = np.argsort(distances, kind='stable')
+        return list(zip(distances[order].tolist(), self.engine.ids[rows[order]].tolist()))
+
+    def ring_cells(self, row, col, ring):
+        """Yield (start, stop) slices of the non-empty cells exactly `ring` cells from (row, col)"""
+        if ring == 0:
+            candidates = [(row, col)]
+        else:
+            candidates = []
+            for offset in range(-ring, ring + 1):
+                candidates.append((row - ring, col + offset))
+                candidates.append((row + ring, col + offset))
+            for offset in range(-ring + 1, ring):
+                candidates.append((row + offset, col - ring))
+                candidates.append((row + offset, col + ring))
+
+        for cell in candidates:
+            span = self.cells.get(cell)
+            if span:
+                yield span
+
+    def distance_outside(self, lat, lon, row, col, ring):
+        """
+        Lower bound in km on the distance from (lat, lon) to any point
+        outside the block of cells within `ring` of (row, col).
+        """
+        lat_gap = min(lat - (row - ring) * self.cell_size, (row + ring + 1) * self.cell_size - lat)
+        lon_gap = min(lon - (col - ring) * self.cell_size, (col + ring + 1) * self.cell_size - lon)
+
+        # Closest approach to a meridian lon_gap away; beyond 90 degrees
+        # the nearest point of such a meridian is the pole
+        pole_gap = math.radians(90 - abs(lat))
+        if lon_gap < 90:
+            lon_bound = min(math.asin(math.cos(math.radians(lat)) * math.sin(math.radians(lon_gap))), pole_gap)
+        else:
+            lon_bound = pole_gap
+
+        return max(0.0, min(math.radians(lat_gap), lon_bound)) * EARTH_RADIUS_KM
+
+    def nearest(self, lat, lon, k, max_km=None):
+        """
+        Return the k nearest hospitals as (distance_km, hospital_id) pairs,
+        nearest first, optionally limited to max_km.
+        Rings of cells are visited outwards from the query cell until the
+        next ring cannot hold anything closer than the current k-th match.
+        """
+        if not self.cells or k <= 0:
+            return []
+
+        row, col = self.cell_for(lat, lon)
+        occupied_rows = [cell_row for cell_row, _ in self.cells]
+        occupied_cols = [cell_col for _, cell_col in self.cells]
+        last_ring = max(
+            abs(row - min(occupied_rows)), abs(row - max(occupied_rows)),
+            abs(col - min(occupied_cols)), abs(col - max(occupied_cols)),
+        )
+
+        heap = []
+        for ring in range(last_ring + 1):
+            rows = self.candidate_rows(self.ring_cells(row, col, ring))
+            if len(rows):
+                distances = self.engine.distances(lat, lon, rows)
+                if max_km is not None:
+                    inside = distances <= max_km
+                    rows, distances = rows[inside], distances[inside]
+                push_bounded(heap, k, distances, self.engine.ids[rows])
+
+            bound = self.distance_outside(lat, lon, row, col, ring)
+            if max_km is not None and bound > max_km:
+                break
+            if len(heap) == k and bound >= -heap[0][0]:
+                break
+
+        return sorted_heap(heap)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_hospital_index():
+    """
+    Return the process-wide hospital index, building it on first use,
+    after an invalidation or once the Hospital table has changed (see
+    versioning.py; imports and other processes send no signals here).
+    """
+    global _index
+    version = current_version()
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            index = _index
+            if index is None or index.version != version:
+                # Built from data at least as new as `version`: a change
+                # committed meanwhile only triggers one more rebuild
+                index = GridIndex.from_queryset(Hospital.objects.all())
+                index.version = version
+                _index = index
+    return index
+
+
+def invalidate_hospital_index():
+    """Drop the cached indexes so the next lookup rebuilds them"""
+    global _index, _emergency_index
+    expire_version()
+    _index = None
+    _emergency_index = None
+
+
+class EmergencyIndex:
+    """
+    Grid index over emergency hospitals only, holding their NEARBY_FIELDS
+    rows as well, so the nearest emergency hospitals are found without
+    touching the database at all.
+    """
+
+    def __init__(self, rows):
+        rows = [row for row in rows if row['latitude'] is not None and row['longitude'] is not None]
+        self.rows = {row['id']: row for row in rows}
+        self.grid = GridIndex(
+            [row['id'] for row in rows],
+            [float(row['latitude']) for row in rows],
+            [float(row['longitude']) for row in rows],
+        )
+        self.version = None
+
+    @classmethod
+    def from_database(cls):
+        return cls(Hospital.objects.filter(has_emergency=True).values(*NEARBY_FIELDS).order_by())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def nearest(self, lat, lon, k, max_km=None):
+        """[(distance_km, row)] for the k nearest emergency hospitals"""
+        return [(distance, self.rows[hospital_id]) for distance, hospital_id in self.grid.nearest(lat, lon, k, max_km)]
+
+
+_emergency_index = None
+# Set once the emergency index has been used, so it is rebuilt eagerly from then on
+_emergency_warm = False
+
+
+def get_emergency_index():
+    """Return the process-wide emergency-only index, rebuilt like get_hospital_index()"""
+    global _emergency_index, _emergency_warm
+    version = current_version()
+    index = _emergency_index
+    if index is None or index.version != version:
+        with _lock:
+            index = _emergency_index
+            if index is None or index.version != version:
+                index = EmergencyIndex.from_database()
+                index.version = version
+                _emergency_index = index
+                _emergency_warm = True
+    return index
+
+
+def warm_emergency_index():
+    """
+    Rebuild the emergency index right away if this process serves
+    emergency lookups, so a severe-symptom request never pays for it
+    """
+    if _emergency_warm:
+        get_emergency_index()
+
+
+def nearest_emergency_hospitals(lat, lon, k=EMERGENCY_RESULTS):
+    """The k nearest emergency hospitals as row dicts with a 'distance' (km)"""
+    return [dict(row, distance=round(distance, 2)) for distance, row in get_emergency_index().nearest(lat, lon, k)]
+
+
+def fetch_hospital_rows(hospital_ids):
+    """Load NEARBY_FIELDS for the given ids as a {id: row dict} mapping"""
+    rows = {}
+    for start in range(0, len(hospital_ids), FETCH_BATCH_SIZE):
+        batch = hospital_ids[start:start + FETCH_BATCH_SIZE]
+        for row in Hospital.objects.filter(pk__in=batch).values(*NEARBY_FIELDS).order_by():
+            rows[row['id']] = row
+    return rows
+
+
+def search_index(lat, lon, radius_km=None, k=None):
+    """Nearby search through the in-process grid index"""
+    if k is None:
+        matches = get_hospital_index().within_radius(lat, lon, radius_km)
+    else:
+        matches = get_hospital_index().nearest(lat, lon, k, radius_km)
+    rows = fetch_hospital_rows([hospital_id for _, hospital_id in matches])
+    # Rows deleted since the index was built are skipped
+    return [(distance, rows[hospital_id]) for distance, hospital_id in matches if hospital_id in rows]
+
+
+def search_database(lat, lon, radius_km=None, k=None):
+    """
+    Nearby search through the database: the radius bounding box is pushed
+    into the WHERE clause (backed by hospital_lat_lon_idx) and only the
+    rows inside it are loaded.
+    """
+    if k is not None:
+        return search_database_nearest(lat, lon, k, radius_km)
+
+    rows = list(
+        Hospital.objects.filter(**bounding_box_filter(lat, lon, radius_km))
+        .values(*NEARBY_FIELDS).order_by()
+    )
+    if not rows:
+        return []
+
+    engine = DistanceEngine(
+        range(len(rows)),
+        [float(row['latitude']) for row in rows],
+        [float(row['longitude']) for row in rows],
+    )
+    distances = engine.distances(lat, lon)
+    inside = np.flatnonzero(distances <= radius_km)
+    order = inside[np.argsort(distances[inside], kind='stable')]
+    return [(distance, rows[position]) for distance, position in zip(distances[order].tolist(), order.tolist())]
+
+
+def search_database_nearest(lat, lon, k, max_km=None):
+    """
+    k-nearest search through the database. The bounding box starts small
+    and doubles until it holds k hospitals whose distances are all within
+    the searched radius (or max_km / the whole globe is reached).
+    """
+    radius_km = INITIAL_SEARCH_RADIUS_KM if max_km is None else min(INITIAL_SEARCH_RADIUS_KM, max_km)
+    limit_km = MAX_SEARCH_RADIUS_KM if max_km is None else min(max_km, MAX_SEARCH_RADIUS_KM)
+
+    while True:
+        rows = {
+            row['id']: row for row in
+            Hospital.objects.filter(**bounding_box_filter(lat, lon, radius_km)).values(*NEARBY_FIELDS).order_by()
+        }
+        heap = []
+        if rows:
+            ids = np.fromiter(rows.keys(), dtype=np.int64, count=len(rows))
+            engine = DistanceEngine(
+                ids,
+                [float(row['latitude']) for row in rows.values()],
+                [float(row['longitude']) for row in rows.values()],
+            )
+            distances = engine.distances(lat, lon)
+            inside = distances <= radius_km
+            push_bounded(heap, k, distances[inside], ids[inside])
+
+        # Everything kept is inside radius_km, so a full heap is final
+        if len(heap) == k or radius_km >= limit_km:
+            return [(distance, rows[hospital_id]) for distance, hospital_id in sorted_heap(heap)]
+        radius_km = min(radius_km * 2, limit_km)
+
+
+def find_nearby_hospitals(lat, lon, radius_km=None, k=None):
+    """
+    Return a list of (distance_km, row) for hospitals within radius_km,
+    nearest first. Each row is a dict of NEARBY_FIELDS.
+    With k, only the k nearest are returned (radius_km is then optional).
+    settings.HOSPITAL_NEARBY_BACKEND picks the in-process grid index
+    ('memory', the default) or the indexed SQL bounding box ('database').
+    """
+    if getattr(settings, 'HOSPITAL_NEARBY_BACKEND', 'memory') == 'database':
+        return search_database(lat, lon, radius_km, k)
+    return search_index(lat, lon, radius_km, k)
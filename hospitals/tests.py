@@ -0,0 +1,540 @@
+"""
+Tests for Hospital Management
+Run with: python manage.py test hospitals
+"""
+import gzip
+import os
+import random
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from hospitals.importing import CsvStream, parse_range, unpack_row
+from hospitals.models import Hospital
+from hospitals.clustering import get_cluster_store, invalidate_cluster_store
+from hospitals.distance import DistanceEngine, haversine_distance
+from hospitals.spatial import (
+    GridIndex, find_nearby_hospitals, get_emergency_index, get_hospital_index, invalidate_hospital_index,
+    nearest_emergency_hospitals,
+)
+from hospitals.versioning import current_version
+
+
+class DistanceEngineTest(TestCase):
+    """Test the vectorized distance engine"""
+
+    def setUp(self):
+        """Set up points for Delhi, Mumbai and Bengaluru"""
+        self.lats = [28.5672, 19.0024, 12.9416]
+        self.lons = [77.2100, 72.8423, 77.5960]
+        self.engine = DistanceEngine([1, 2, 3], self.lats, self.lons)
+
+    def test_distances_match_haversine(self):
+        """Test that the vectorized pass agrees with the scalar formula"""
+        distances = self.engine.distances(28.6139, 77.2090)
+        for distance, lat, lon in zip(distances, self.lats, self.lons):
+            self.assertAlmostEqual(distance, haversine_distance(28.6139, 77.2090, lat, lon), places=6)
+
+    def test_distance_matrix_shape(self):
+        """Test that a batch of query points returns one row per query"""
+        matrix = self.engine.distance_matrix([28.6139, 19.0760], [77.2090, 72.8777])
+        self.assertEqual(matrix.shape, (2, 3))
+        self.assertAlmostEqual(matrix[1, 1], haversine_distance(19.0760, 72.8777, 19.0024, 72.8423), places=6)
+
+
+class GridIndexTest(TestCase):
+    """Test the in-process spatial grid index"""
+
+    def setUp(self):
+        """Set up hospitals in Delhi, Mumbai and Bengaluru"""
+        # Test transactions never commit, so start from fresh indexes
+        invalidate_hospital_index()
+        self.delhi = Hospital.objects.create(name='AIIMS Delhi', state='Delhi', latitude=28.5672, longitude=77.2100)
+        self.mumbai = Hospital.objects.create(name='KEM Hospital', state='Maharashtra', latitude=19.0024, longitude=72.8423)
+        self.bengaluru = Hospital.objects.create(name='NIMHANS', state='Karnataka', latitude=12.9416, longitude=77.5960)
+        Hospital.objects.create(name='No GPS Clinic', state='Delhi')
+
+    def test_index_skips_hospitals_without_coordinates(self):
+        """Test that only hospitals with coordinates are indexed"""
+        index = GridIndex.from_queryset(Hospital.objects.all())
+        self.assertEqual(index.size, 3)
+
+    def test_within_radius_matches_brute_force(self):
+        """Test that the grid returns the same hospitals as a full scan"""
+        index = GridIndex.from_queryset(Hospital.objects.all())
+        for radius in (10, 500, 1200, 5000):
+            expected = sorted(
+                hospital.id for hospital in Hospital.objects.exclude(latitude__isnull=True)
+                if haversine_distance(28.6139, 77.2090, float(hospital.latitude), float(hospital.longitude)) <= radius
+            )
+            found = sorted(hospital_id for _, hospital_id in index.within_radius(28.6139, 77.2090, radius))
+            self.assertEqual(found, expected)
+
+    def test_index_rebuilds_when_hospital_changes(self):
+        """Test that saving or deleting a hospital refreshes the shared index"""
+        self.assertEqual(get_hospital_index().size, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Hospital.objects.create(name='Safdarjung Hospital', state='Delhi', latitude=28.5677, longitude=77.2075)
+        self.assertEqual(get_hospital_index().size, 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mumbai.delete()
+        self.assertEqual(get_hospital_index().size, 3)
+
+    def test_index_waits_for_commit(self):
+        """Test that an uncommitted save leaves the index alone"""
+        index = get_hospital_index()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.delhi.save()
+        self.assertIs(get_hospital_index(), index)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_changes_without_signals_are_noticed(self):
+        """Test that rows written by bulk imports or other processes reach the indexes"""
+        get_hospital_index()
+        get_emergency_index()
+        get_cluster_store()
+        Hospital.objects.bulk_create([
+            Hospital(name='Safdarjung Hospital', state='Delhi', latitude=28.5677, longitude=77.2075, has_emergency=True),
+        ])
+        Hospital.objects.filter(pk=self.mumbai.pk).delete()
+        with mock.patch('hospitals.versioning._next_check', 0.0):
+            self.assertEqual(get_hospital_index().size, 3)
+        self.assertEqual(get_emergency_index().grid.size, 1)
+        self.assertEqual(get_cluster_store().hospitals.keys(), {self.delhi.pk, self.bengaluru.pk,
+                                                                Hospital.objects.get(name='Safdarjung Hospital').pk})
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+    def test_latest_change_read_from_index(self):
+        """Test that the version's latest updated_at comes from hospital_updated_at_idx"""
+        sql, params = Hospital.objects.order_by('-updated_at').values_list('updated_at')[:1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('hospital_updated_at_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_version_read_is_throttled(self):
+        """Test that the table version is not queried on every lookup"""
+        current_version()
+        with self.assertNumQueries(0):
+            current_version()
+
+
+class NearestHospitalsTest(TestCase):
+    """Test k-nearest search against a brute-force scan"""
+
+    def setUp(self):
+        """Set up random hospitals across India"""
+        rng = random.Random(42)
+        Hospital.objects.bulk_create([
+            Hospital(name=f'Hospital {i}', state='Test',
+                     latitude=round(rng.uniform(8, 35), 6), longitude=round(rng.uniform(68, 97), 6))
+            for i in range(300)
+        ])
+        self.points = [
+            (hospital.id, float(hospital.latitude), float(hospital.longitude))
+            for hospital in Hospital.objects.all()
+        ]
+
+    def brute_force(self, lat, lon, k, max_km=None):
+        distances = sorted(
+            (haversine_distance(lat, lon, point_lat, point_lon), hospital_id)
+            for hospital_id, point_lat, point_lon in self.points
+        )
+        if max_km is not None:
+            distances = [match for match in distances if match[0] <= max_km]
+        return [hospital_id for _, hospital_id in distances[:k]]
+
+    def test_grid_nearest_matches_brute_force(self):
+        """Test ring expansion finds exactly the k nearest hospitals"""
+        index = GridIndex.from_queryset(Hospital.objects.all())
+        for lat, lon, k, max_km in [(28.6, 77.2, 5, None), (20.6, 79.0, 50, None), (13.0, 77.6, 10, 150), (40.0, 60.0, 3, None)]:
+            found = [hospital_id for _, hospital_id in index.nearest(lat, lon, k, max_km)]
+            self.assertEqual(found, self.brute_force(lat, lon, k, max_km))
+
+    @override_settings(HOSPITAL_NEARBY_BACKEND='database')
+    def test_database_nearest_matches_brute_force(self):
+        """Test the expanding bounding box finds exactly the k nearest hospitals"""
+        for lat, lon, k, max_km in [(28.6, 77.2, 5, None), (13.0, 77.6, 10, 150)]:
+            found = [row['id'] for _, row in find_nearby_hospitals(lat, lon, max_km, k)]
+            self.assertEqual(found, self.brute_force(lat, lon, k, max_km))
+
+
+class NearbyHospitalsTest(TestCase):
+    """Test the nearby hospitals API endpoint"""
+
+    def setUp(self):
+        """Set up test data"""
+        invalidate_hospital_index()
+        Hospital.objects.create(name='AIIMS Delhi', state='Delhi', latitude=28.5672, longitude=77.2100)
+        Hospital.objects.create(name='GTB Hospital', state='Delhi', latitude=28.6800, longitude=77.3160)
+        Hospital.objects.create(name='KEM Hospital', state='Maharashtra', latitude=19.0024, longitude=72.8423)
+
+    def test_nearby_sorted_by_distance(self):
+        """Test that only hospitals inside the radius are returned, nearest first"""
+        response = self.client.get(reverse('hospitals:nearby_hospitals'), {'lat': 28.6139, 'lon': 77.2090, 'radius': 50})
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([h['name'] for h in data['hospitals']], ['AIIMS Delhi', 'GTB Hospital'])
+
+    @override_settings(HOSPITAL_NEARBY_BACKEND='database')
+    def test_database_backend_matches_index(self):
+        """Test that the SQL bounding-box search returns the same hospitals"""
+        response = self.client.get(reverse('hospitals:nearby_hospitals'), {'lat': 28.6139, 'lon': 77.2090, 'radius': 50})
+        data = response.json()
+        self.assertEqual([h['name'] for h in data['hospitals']], ['AIIMS Delhi', 'GTB Hospital'])
+
+    def test_k_nearest_ignores_default_radius(self):
+        """Test that k returns the nearest hospitals however far they are"""
+        response = self.client.get(reverse('hospitals:nearby_hospitals'), {'lat': 28.6139, 'lon': 77.2090, 'k': 3})
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['hospitals'][-1]['name'], 'KEM Hospital')
+
+    def test_limit_caps_radius_results(self):
+        """Test that limit keeps only the nearest hospitals inside the radius"""
+        response = self.client.get(reverse('hospitals:nearby_hospitals'), {'lat': 28.6139, 'lon': 77.2090, 'radius': 5000, 'limit': 1})
+        data = response.json()
+        self.assertEqual([h['name'] for h in data['hospitals']], ['AIIMS Delhi'])
+
+    def test_invalid_parameters(self):
+        """Test that missing coordinates and bad counts are rejected"""
+        response = self.client.get(reverse('hospitals:nearby_hospitals'), {'lat': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('hospitals:nearby_hospitals'), {'lat': 28.6, 'lon': 77.2, 'k': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_finite_parameters(self):
+        """Test that NaN, infinite or out-of-range values are rejected rather than crashing"""
+        for params in ({'lat': 'nan', 'lon': 77.2}, {'lat': 28.6, 'lon': 'inf'}, {'lat': 91, 'lon': 77.2},
+                       {'lat': 28.6, 'lon': 77.2, 'radius': 'nan'}, {'lat': 28.6, 'lon': 77.2, 'radius': 'inf'},
+                       {'lat': 28.6, 'lon': 77.2, 'radius': -5}):
+            response = self.client.get(reverse('hospitals:nearby_hospitals'), params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class EmergencyHospitalsTest(TestCase):
+    """Test the emergency-only index and the emergency page"""
+
+    def setUp(self):
+        invalidate_hospital_index()
+        Hospital.objects.create(name='AIIMS Delhi', state='Delhi', latitude=28.5672, longitude=77.2100, has_emergency=True)
+        Hospital.objects.create(name='Clinic Delhi', state='Delhi', latitude=28.6140, longitude=77.2091)
+        Hospital.objects.create(name='GTB Hospital', state='Delhi', latitude=28.6800, longitude=77.3160, has_emergency=True)
+        Hospital.objects.create(name='KEM Hospital', state='Maharashtra', latitude=19.0024, longitude=72.8423, has_emergency=True)
+
+    def test_nearest_emergency_only(self):
+        """Test that only emergency hospitals are returned, nearest first, from memory"""
+        get_emergency_index()
+        with self.assertNumQueries(0):
+            hospitals = nearest_emergency_hospitals(28.6139, 77.2090, k=2)
+        self.assertEqual([h['name'] for h in hospitals], ['AIIMS Delhi', 'GTB Hospital'])
+        self.assertLess(hospitals[0]['distance'], hospitals[1]['distance'])
+
+    def test_changes_reach_the_index(self):
+        """Test that a hospital gaining emergency services is found"""
+        nearest_emergency_hospitals(28.6139, 77.2090)
+        clinic = Hospital.objects.get(name='Clinic Delhi')
+        clinic.has_emergency = True
+        with self.captureOnCommitCallbacks(execute=True):
+            clinic.save()
+        self.assertEqual(nearest_emergency_hospitals(28.6139, 77.2090, k=1)[0]['name'], 'Clinic Delhi')
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_emergency_page_nearest_first(self):
+        """Test that the emergency page lists the nearest hospitals when given a location"""
+        response = self.client.get(reverse('hospitals:emergency'), {'lat': 19.0, 'lon': 72.8})
+        self.assertEqual([h['name'] for h in response.context['emergency_hospitals']],
+                         ['KEM Hospital', 'AIIMS Delhi', 'GTB Hospital'])
+
+        response = self.client.get(reverse('hospitals:emergency'), {'lat': 'x', 'lon': 72.8})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['emergency_hospitals']), 3)
+
+
+class HospitalClustersTest(TestCase):
+    """Test the map clustering endpoint"""
+
+    def setUp(self):
+        """Set up hospitals in Delhi and Mumbai"""
+        # Test transactions never commit, so start from a fresh store
+        invalidate_cluster_store()
+        self.aiims = Hospital.objects.create(name='AIIMS Delhi', state='Delhi', latitude=28.5672, longitude=77.2100, has_emergency=True)
+        self.safdarjung = Hospital.objects.create(name='Safdarjung Hospital', state='Delhi', latitude=28.5677, longitude=77.2075)
+        self.kem = Hospital.objects.create(name='KEM Hospital', state='Maharashtra', latitude=19.0024, longitude=72.8423)
+
+    def get_clusters(self, **params):
+        response = self.client.get(reverse('hospitals:hospital_clusters'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_zoomed_out_groups_nearby_hospitals(self):
+        """Test that hospitals in the same city share a cluster when zoomed out"""
+        data = self.get_clusters(zoom=5, bbox='68,8,97,35')
+        self.assertEqual(data['count'], 3)
+        counts = sorted((cluster[2], cluster[3]) for cluster in data['clusters'])
+        self.assertEqual(counts, [(1, 0), (2, 1)])
+
+    def test_zoomed_in_returns_single_hospitals(self):
+        """Test that single-hospital clusters carry the hospital id"""
+        data = self.get_clusters(zoom=16, bbox='77.2,28.5,77.3,28.6')
+        self.assertEqual(sorted(cluster[4] for cluster in data['clusters']), sorted([self.aiims.id, self.safdarjung.id]))
+
+    def test_clusters_follow_hospital_changes(self):
+        """Test that clusters update incrementally on save and delete"""
+        self.get_clusters(zoom=5)
+        self.kem.latitude, self.kem.longitude = 28.6, 77.2
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kem.save()
+        data = self.get_clusters(zoom=5, bbox='68,8,97,35')
+        self.assertEqual([cluster[2] for cluster in data['clusters']], [3])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.aiims.delete()
+        data = self.get_clusters(zoom=5, bbox='68,8,97,35')
+        self.assertEqual(data['count'], 2)
+
+    def test_sync_loads_rows_stamped_before_the_last_sync(self):
+        """Test that a row committed with an old updated_at still joins the clusters"""
+        store = get_cluster_store()
+        late = Hospital.objects.create(name='Late Clinic', state='Goa', latitude=15.5, longitude=73.8)
+        Hospital.objects.filter(pk=late.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        with mock.patch('hospitals.versioning._next_check', 0.0):
+            self.assertIs(get_cluster_store(), store)
+        self.assertIn(late.pk, store.hospitals)
+        self.assertIn(late.pk, store.row_ids)
+
+    def test_invalid_bbox(self):
+        """Test that a malformed bounding box is rejected"""
+        response = self.client.get(reverse('hospitals:hospital_clusters'), {'bbox': '1,2,3'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('hospitals:hospital_clusters'), {'bbox': 'nan,8,97,35'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('hospitals:hospital_clusters'), {'bbox': '68,8,inf,35'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportHospitalsTest(TestCase):
+    """Test the import_hospitals management command"""
+
+    def run_import(self, *args):
+        call_command('import_hospitals', '--file', 'data/india_hospitals.csv', *args, stdout=StringIO())
+
+    def test_bulk_import_matches_row_import(self):
+        """Test that --bulk imports the same hospitals as the row-by-row path"""
+        self.run_import()
+        expected = set(Hospital.objects.values_list('name', 'state', 'latitude', 'has_emergency'))
+        Hospital.objects.all().delete()
+
+        self.run_import('--bulk', '--batch-size', '7')
+        self.assertEqual(set(Hospital.objects.values_list('name', 'state', 'latitude', 'has_emergency')), expected)
+
+    def test_gzip_input(self):
+        """Test that gzip-compressed CSV files are read directly"""
+        self.run_import('--bulk')
+        expected = Hospital.objects.count()
+        Hospital.objects.all().delete()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hospitals.csv.gz')
+            with open('data/india_hospitals.csv', 'rb') as source, gzip.open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            call_command('import_hospitals', '--file', path, '--bulk', stdout=StringIO())
+            self.assertEqual(Hospital.objects.count(), expected)
+            Hospital.objects.all().delete()
+            call_command('import_hospitals', '--file', path, '--workers', '2', '--chunk-size', '7', stdout=StringIO())
+        self.assertEqual(Hospital.objects.count(), expected)
+
+    def test_resume_after_interrupted_import(self):
+        """Test that --resume continues from the last committed chunk"""
+        from hospitals import importing
+
+        self.run_import('--bulk')
+        expected = set(Hospital.objects.values_list('name', 'state'))
+        Hospital.objects.all().delete()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hospitals.csv')
+            shutil.copy('data/india_hospitals.csv', path)
+
+            calls = []
+
+            def crash_on_third_chunk(rows, batch_size):
+                calls.append(len(rows))
+                if len(calls) == 3:
+                    raise RuntimeError('simulated crash')
+                return importing.insert_new(rows, batch_size)
+
+            with mock.patch('hospitals.management.commands.import_hospitals.insert_new', crash_on_third_chunk):
+                call_command('import_hospitals', '--file', path, '--bulk', '--chunk-size', '10', stdout=StringIO())
+            self.assertEqual(Hospital.objects.count(), 20)
+            self.assertTrue(os.path.exists(f'{path}.checkpoint'))
+
+            out = StringIO()
+            call_command('import_hospitals', '--file', path, '--resume', '--chunk-size', '10', stdout=out)
+            self.assertIn('Resuming after row 20', out.getvalue())
+            self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+        self.assertEqual(Hospital.objects.count(), len(expected))
+        self.assertEqual(set(Hospital.objects.values_list('name', 'state')), expected)
+
+    def test_parallel_import_matches_bulk_import(self):
+        """Test that --workers parses in processes and imports the same hospitals"""
+        self.run_import('--bulk')
+        expected = set(Hospital.objects.values_list('name', 'state', 'latitude', 'beds_available'))
+        Hospital.objects.all().delete()
+
+        self.run_import('--workers', '2', '--chunk-size', '7')
+        self.assertEqual(set(Hospital.objects.values_list('name', 'state', 'latitude', 'beds_available')), expected)
+
+    def test_worker_ranges_keep_quoted_records_whole(self):
+        """Test that workers get whole records even when a quoted field spans lines"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hospitals.csv')
+            with open(path, 'w', encoding='utf-8', newline='') as target:
+                target.write('facility_name,state_name,district_name,facility_type,address,latitude,longitude,contact,has_emergency\n'
+                             'Clinic A,Goa,North Goa,PHC,"Main Road\nPanaji, ""Old"" Town",15.5,73.8,,True\n'
+                             'Clinic B,Goa,North Goa,PHC,,15.6,73.9,,False\n')
+            with CsvStream(path) as stream:
+                results = [parse_range(path, stream.header, start, end, data) for start, end, data in stream.ranges(1)]
+
+        self.assertEqual([result[3] for result in results], [1, 1])
+        first = unpack_row(results[0][0][0])
+        self.assertEqual(first['address'], 'Main Road\nPanaji, "Old" Town')
+        self.assertEqual((first['latitude'], first['has_emergency']), ('15.500000', True))
+
+    def test_rejected_rows_reported_per_chunk(self):
+        """Test that bad rows are summarized once per chunk"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hospitals.csv')
+            rows = [f'Clinic {n},Goa,North Goa,PHC,,{"bad" if n % 2 else "15.5"},73.8,,False' for n in range(8)]
+            with open(path, 'w', encoding='utf-8') as target:
+                target.write('facility_name,state_name,district_name,facility_type,address,latitude,longitude,contact,has_emergency\n')
+                target.write('\n'.join(rows) + '\n')
+
+            out = StringIO()
+            call_command('import_hospitals', '--file', path, '--workers', '2', '--chunk-size', '4', stdout=out)
+
+        errors = [line for line in out.getvalue().splitlines() if 'rejected' in line]
+        self.assertEqual(len(errors), 2)
+        self.assertIn('Rows 1-4: 2 rejected', errors[0])
+        self.assertIn('Clinic 1', errors[0])
+        self.assertEqual(Hospital.objects.count(), 4)
+
+    def test_out_of_range_coordinates_rejected(self):
+        """Test that bulk and diff imports reject bad coordinates row by row instead of aborting"""
+        for mode in ('--bulk', '--diff'):
+            Hospital.objects.all().delete()
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'hospitals.csv')
+                with open(path, 'w', encoding='utf-8') as target:
+                    target.write('facility_name,state_name,district_name,facility_type,address,latitude,longitude,contact,has_emergency\n'
+                                 'Clinic North,Goa,North Goa,PHC,,95.5,73.8,,False\n'
+                                 'Clinic West,Goa,North Goa,PHC,,15.5,-181,,False\n'
+                                 'Clinic Far,Goa,North Goa,PHC,,15.5,12345.5,,False\n'
+                                 'Clinic NaN,Goa,North Goa,PHC,,NaN,73.8,,False\n'
+                                 'Clinic Goa,Goa,North Goa,PHC,,15.49999949,73.8,,False\n')
+                out = StringIO()
+                call_command('import_hospitals', '--file', path, mode, stdout=out)
+
+            self.assertIn('Clinic NaN', out.getvalue())
+            hospital = Hospital.objects.get()
+            self.assertEqual((hospital.name, hospital.latitude), ('Clinic Goa', Decimal('15.499999')))
+
+    def test_bulk_import_skips_existing(self):
+        """Test that re-running a bulk import does not duplicate hospitals"""
+        self.run_import('--bulk')
+        count = Hospital.objects.count()
+        self.run_import('--bulk')
+        self.assertEqual(Hospital.objects.count(), count)
+        self.assertEqual(get_hospital_index().size, count)
+
+    def test_diff_import_touches_only_changes(self):
+        """Test that --diff inserts and updates only what changed, removing only with --delete-missing"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hospitals.csv')
+            with open('data/india_hospitals.csv', encoding='utf-8') as source:
+                lines = source.read().splitlines()
+            header, rows = lines[0], lines[1:]
+            with open(path, 'w', encoding='utf-8') as target:
+                target.write('\n'.join([header] + rows) + '\n')
+            call_command('import_hospitals', '--file', path, '--diff', stdout=StringIO())
+            self.assertEqual(Hospital.objects.count(), len(rows))
+
+            untouched = Hospital.objects.get(name=rows[1].split(',')[0])
+            changed_name = rows[0].split(',')[0]
+            removed_name = rows[2].split(',')[0]
+            refreshed = [rows[0].replace(rows[0].split(',')[7], '011-00000000')] + rows[1:2] + rows[3:]
+            refreshed.append('New PHC,Delhi,New Delhi,PHC,Somewhere,28.6,77.2,0110000000,False')
+            with open(path, 'w', encoding='utf-8') as target:
+                target.write('\n'.join([header] + refreshed) + '\n')
+
+            out = StringIO()
+            call_command('import_hospitals', '--file', path, '--diff', stdout=out)
+            self.assertIn('Inserted: 1', out.getvalue())
+            self.assertIn('Updated: 1', out.getvalue())
+            self.assertIn('Removed: 0 hospitals (1 missing from the file kept', out.getvalue())
+            self.assertTrue(Hospital.objects.filter(name=removed_name).exists())
+
+            out = StringIO()
+            call_command('import_hospitals', '--file', path, '--diff', '--delete-missing', stdout=out)
+
+        self.assertIn('Inserted: 0', out.getvalue())
+        self.assertIn('Removed: 1 hospitals\n', out.getvalue())
+        self.assertEqual(Hospital.objects.get(name=changed_name).contact_number, '011-00000000')
+        self.assertFalse(Hospital.objects.filter(name=removed_name).exists())
+        self.assertTrue(Hospital.objects.filter(name='New PHC').exists())
+        self.assertEqual(Hospital.objects.get(pk=untouched.pk).updated_at, untouched.updated_at)
+
+    def test_copy_buffer_format(self):
+        """Test that the COPY payload keeps NULLs distinct from empty strings"""
+        import csv
+        from hospitals.importing import COPY_NULL, IMPORTED_FIELDS, copy_buffer, parse_row
+
+        fields = parse_row({
+            'facility_name': 'Care, "Plus" Clinic', 'state_name': 'Goa', 'district_name': 'North Goa',
+            'facility_type': 'PHC', 'address': '', 'latitude': '', 'longitude': '73.8', 'contact': '',
+            'has_emergency': 'yes',
+        })
+        values = next(csv.reader(copy_buffer([fields])))
+        record = dict(zip(IMPORTED_FIELDS + ('row_hash', 'position'), values))
+        self.assertEqual(record['name'], 'Care, "Plus" Clinic')
+        self.assertEqual(record['address'], '')
+        self.assertEqual(record['latitude'], COPY_NULL)
+        self.assertEqual(record['has_emergency'], 't')
+        self.assertEqual(record['row_hash'], fields['row_hash'])
+        self.assertEqual(record['position'], '0')
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL')
+    def test_copy_insert_merges_new_rows(self):
+        """Test that the COPY path skips stored and duplicate hospitals"""
+        from hospitals.importing import copy_insert_new, parse_row
+
+        def row(name, contact):
+            return parse_row({
+                'facility_name': name, 'state_name': 'Goa', 'district_name': 'North Goa',
+                'latitude': '15.5', 'longitude': '73.8', 'contact': contact,
+            })
+
+        Hospital.objects.create(**row('Stored', '1'))
+        inserted, skipped = copy_insert_new([row('Stored', '2'), row('New', '3'), row('New', '4')])
+        self.assertEqual((inserted, skipped), (1, 2))
+        self.assertEqual(Hospital.objects.get(name='New').contact_number, '3')
+        self.assertEqual(Hospital.objects.get(name='Stored').contact_number, '1')
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL')
+    def test_copy_insert_in_outer_transaction(self):
+        """Test that several COPY chunks work inside one outer transaction (staging table dropped)"""
+        call_command('import_hospitals', '--file', 'data/india_hospitals.csv', '--bulk', '--chunk-size', '7',
+                     stdout=StringIO())
+        # More than one chunk was merged
+        self.assertGreater(Hospital.objects.count(), 7)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pg_temp.hospital_import_stage')")
+            self.assertIsNone(cursor.fetchone()[0])
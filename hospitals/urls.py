@@ -9,6 +9,7 @@ app_name = 'hospitals'
 urlpatterns = [
     path('', views.hospital_list, name='hospital_list'),
     path('nearby/', views.nearby_hospitals, name='nearby_hospitals'),
+    path('clusters/', views.hospital_clusters, name='hospital_clusters'),
     path('emergency/', views.emergency_page, name='emergency'),
     path('<int:pk>/', views.hospital_detail, name='hospital_detail'),
 ]
@@ -0,0 +1,52 @@
+"""
+Detecting Hospital table changes made by other processes
+
+The structures built from the Hospital table (grid and emergency indexes,
+map clusters) live in each process's memory. Signals only reach the
+process that saved a row, and bulk imports send none, so every structure
+remembers the table version it was built from and is rebuilt once the
+version moves on. The version is the row count and the latest updated_at,
+read at most every VERSION_CHECK_SECONDS per process: inserts, updates
+through save()/bulk_update and deletes all change it. Raise
+VERSION_CHECK_SECONDS if the count of a very large table shows up.
+"""
+import threading
+import time
+
+from .models import Hospital
+
+# Seconds between two reads of the table version in one process
+VERSION_CHECK_SECONDS = 2.0
+
+_version = None
+_next_check = 0.0
+_lock = threading.Lock()
+
+
+def table_version():
+    """
+    (row count, latest updated_at) of the Hospital table, read now.
+    The latest updated_at is one step down hospital_updated_at_idx. The
+    count, which catches deletes, still scans the table (or its smallest
+    index), so it grows with the registry; it is paid at most once per
+    VERSION_CHECK_SECONDS per process, not per request.
+    """
+    latest = Hospital.objects.order_by('-updated_at').values_list('updated_at', flat=True).first()
+    return Hospital.objects.order_by().count(), latest
+
+
+def current_version():
+    """The table version, re-read when the last read is VERSION_CHECK_SECONDS old"""
+    global _version, _next_check
+    if time.monotonic() >= _next_check:
+        with _lock:
+            if time.monotonic() >= _next_check:
+                _version = table_version()
+                _next_check = time.monotonic() + VERSION_CHECK_SECONDS
+    return _version
+
+
+def expire_version():
+    """Re-read the version on the next lookup (this process just changed the table)"""
+    global _next_check
+    _next_check = 0.0
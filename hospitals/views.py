@@ -1,12 +1,18 @@
 """
 Views for Hospital Management
 """
+import math
+
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from .models import Hospital
-import math
+from .clustering import get_cluster_store
+from .spatial import find_nearby_hospitals, nearest_emergency_hospitals, parse_coordinates
+
+# Upper bound for the k / limit query parameters of nearby_hospitals
+MAX_NEARBY_RESULTS = 1000
 
 
 def hospital_list(request):
@@ -53,73 +59,58 @@ def hospital_detail(request, pk):
     return render(request, 'hospitals/hospital_detail.html', context)
 
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    Returns distance in kilometers
-    """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
-
-
 @require_http_methods(["GET"])
 def nearby_hospitals(request):
     """
     API endpoint to find nearby hospitals based on user's GPS location
-    Query params: lat, lon, radius (default 100 km)
+    Query params: lat, lon, radius (default 100 km),
+                  k (k nearest hospitals, radius optional),
+                  limit (at most this many of the nearest within radius)
     Returns: JSON list of nearby hospitals sorted by distance
     """
+    coordinates = parse_coordinates(request.GET.get('lat'), request.GET.get('lon'))
     try:
-        user_lat = float(request.GET.get('lat'))
-        user_lon = float(request.GET.get('lon'))
-        radius = float(request.GET.get('radius', 100))  # default 100 km
+        if coordinates is None:
+            raise ValueError
+        user_lat, user_lon = coordinates
+        k = int(request.GET['k']) if request.GET.get('k') else None
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+        if request.GET.get('radius'):
+            radius = float(request.GET['radius'])
+            if not math.isfinite(radius) or radius < 0:
+                raise ValueError
+        else:
+            radius = None if k else 100.0  # default 100 km
+        if any(value is not None and not 0 < value <= MAX_NEARBY_RESULTS for value in (k, limit)):
+            raise ValueError
     except (TypeError, ValueError):
         return JsonResponse({
-            'error': 'Invalid parameters. Required: lat, lon. Optional: radius (km)'
+            'error': 'Invalid parameters. Required: lat, lon. Optional: radius (km), '
+                     f'k or limit (1-{MAX_NEARBY_RESULTS})'
         }, status=400)
     
-    # Get all hospitals with GPS coordinates
-    hospitals = Hospital.objects.exclude(latitude__isnull=True).exclude(longitude__isnull=True)
+    # k and limit both ask for the nearest N; with both, the smaller wins
+    counts = [value for value in (k, limit) if value is not None]
+    count = min(counts) if counts else None
     
-    # Calculate distance for each hospital
+    # Only hospitals near the requested point are loaded, as plain values
     nearby = []
-    for hospital in hospitals:
-        distance = haversine_distance(
-            user_lat, user_lon,
-            float(hospital.latitude), float(hospital.longitude)
-        )
-        
-        if distance <= radius:
-            nearby.append({
-                'id': hospital.id,
-                'name': hospital.name,
-                'address': hospital.address,
-                'city': hospital.city,
-                'state': hospital.state,
-                'contact_number': hospital.contact_number,
-                'has_emergency': hospital.has_emergency,
-                'has_ambulance': hospital.has_ambulance,
-                'beds_available': hospital.beds_available,
-                'rating': float(hospital.rating),
-                'latitude': float(hospital.latitude),
-                'longitude': float(hospital.longitude),
-                'distance': round(distance, 2)
-            })
-    
-    # Sort by distance
-    nearby.sort(key=lambda x: x['distance'])
+    for distance, hospital in find_nearby_hospitals(user_lat, user_lon, radius, count):
+        nearby.append({
+            'id': hospital['id'],
+            'name': hospital['name'],
+            'address': hospital['address'],
+            'city': hospital['city'],
+            'state': hospital['state'],
+            'contact_number': hospital['contact_number'],
+            'has_emergency': hospital['has_emergency'],
+            'has_ambulance': hospital['has_ambulance'],
+            'beds_available': hospital['beds_available'],
+            'rating': float(hospital['rating']),
+            'latitude': float(hospital['latitude']),
+            'longitude': float(hospital['longitude']),
+            'distance': round(distance, 2)
+        })
     
     return JsonResponse({
         'success': True,
@@ -129,18 +120,58 @@ def nearby_hospitals(request):
             'longitude': user_lon
         },
         'radius_km': radius,
+        'limit': count,
         'hospitals': nearby
     })
 
 
+@require_http_methods(["GET"])
+def hospital_clusters(request):
+    """
+    API endpoint with map marker clusters for a zoom level and viewport
+    Query params: zoom (0-19), bbox=west,south,east,north (default: whole map)
+    Returns: JSON list of [lat, lon, count, emergency_count, hospital_id]
+             where hospital_id is only set for single-hospital clusters
+    """
+    try:
+        zoom = int(request.GET.get('zoom', 5))
+        bbox = request.GET.get('bbox')
+        if bbox:
+            west, south, east, north = (float(value) for value in bbox.split(','))
+            if not all(math.isfinite(value) for value in (west, south, east, north)):
+                raise ValueError
+        else:
+            west, south, east, north = -180.0, -90.0, 180.0, 90.0
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'error': 'Invalid parameters. Optional: zoom, bbox=west,south,east,north'
+        }, status=400)
+    
+    clusters = get_cluster_store().clusters(zoom, south, west, north, east)
+    
+    return JsonResponse({
+        'success': True,
+        'zoom': zoom,
+        'count': sum(cluster[2] for cluster in clusters),
+        'fields': ['latitude', 'longitude', 'count', 'emergency_count', 'hospital_id'],
+        'clusters': clusters
+    })
+
+
 def emergency_page(request):
     """
     Emergency page showing emergency hospitals and ambulance services
     """
-    emergency_hospitals = Hospital.objects.filter(has_emergency=True)[:10]
+    # Nearest ones when the page is opened with the user's location
+    coordinates = parse_coordinates(request.GET.get('lat'), request.GET.get('lon'))
+    if coordinates:
+        emergency_hospitals = nearest_emergency_hospitals(*coordinates, k=10)
+    else:
+        emergency_hospitals = Hospital.objects.filter(has_emergency=True)[:10]
     
     context = {
         'emergency_hospitals': emergency_hospitals,
+        'located': coordinates is not None,
         'emergency_number': '112',  # Configurable emergency number
         'ambulance_number': '108',
     }
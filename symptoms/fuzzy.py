@@ -0,0 +1,109 @@
+"""
+Typo-tolerant lookup of keyword words
+
+A character-trigram index over the keyword vocabulary narrows a misspelt
+word down to the few words sharing enough trigrams with it, and only
+those get a (bounded) edit distance computation. A word within edit
+distance d of the query keeps at least len(trigrams) - 4 * d of them,
+since one edit (counting an adjacent swap as one) touches at most four.
+"""
+from collections import Counter
+
+# Shorter words are not corrected: 'tough' is one edit from 'cough'
+MIN_FUZZY_LENGTH = 6
+
+# Words this long may be two edits away from their keyword word
+TWO_EDIT_LENGTH = 9
+
+# Distinct looked-up words remembered per index (it is rebuilt with the knowledge base)
+MAX_MEMOIZED = 50000
+
+
+def trigrams(word):
+    """Trigrams of the word padded with one boundary marker on each side"""
+    padded = f'${word}$'
+    return [padded[index:index + 3] for index in range(len(padded) - 2)]
+
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance (insertions, deletions,
+    substitutions and adjacent transpositions), or limit + 1 once it is
+    certain to exceed limit. Only the diagonal band of width 2 * limit + 1
+    is computed; cells outside it are over the limit anyway.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous_previous = None
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        for j in range(low, high + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = min(value, over)
+        if min(current[low - 1:high + 1]) > limit:
+            return over
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """
+    (trigram, word length) -> words posting lists for bounded edit
+    distance lookups. Keying on length as well means only words whose
+    length is within the edit limit are ever counted. Answers are
+    memoized, since the same unknown words ("yesterday") recur.
+    """
+
+    def __init__(self, words):
+        self.postings = {}
+        self.memo = {}
+        for word in set(words):
+            if len(word) >= MIN_FUZZY_LENGTH - 1 and word.isalpha():
+                for gram in set(trigrams(word)):
+                    self.postings.setdefault((gram, len(word)), []).append(word)
+
+    def lookup(self, word):
+        """
+        The closest indexed word within the allowed distance (1, or 2 for
+        long words), or None. Ties go to the word sharing most trigrams,
+        then alphabetical order.
+        """
+        if len(word) < MIN_FUZZY_LENGTH or not word.isalpha():
+            return None
+        try:
+            return self.memo[word]
+        except KeyError:
+            pass
+        found = self._search(word)
+        if len(self.memo) < MAX_MEMOIZED:
+            self.memo[word] = found
+        return found
+
+    def _search(self, word):
+        limit = 2 if len(word) >= TWO_EDIT_LENGTH else 1
+        grams = set(trigrams(word))
+        shared = Counter()
+        for length in range(len(word) - limit, len(word) + limit + 1):
+            for gram in grams:
+                shared.update(self.postings.get((gram, length), ()))
+
+        # Most shared trigrams first: once a match is found, only a strictly
+        # closer word could replace it, which lets the scan stop early
+        best = None
+        for candidate, count in sorted(shared.items(), key=lambda item: (-item[1], item[0])):
+            if count < len(grams) - 4 * limit:
+                break
+            distance = edit_distance(word, candidate, limit)
+            if distance <= limit:
+                best = candidate
+                limit = distance - 1
+                if limit < 1:
+                    break
+        return best
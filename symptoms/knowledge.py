@@ -0,0 +1,134 @@
+"""
+Symptom knowledge base
+
+Categories, keywords, weights and advice live in a versioned JSON file
+(settings.SYMPTOM_KNOWLEDGE_BASE). It is compiled into an immutable
+KnowledgeBase holding the matcher and scorer. When the file changes, the
+next request compiles the new version while others keep using the
+current one, then the module-level reference is swapped in one
+assignment, so a running worker never needs a restart and no request
+waits for a reload or sees a half-built knowledge base.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .matcher import KeywordMatcher
+from .scoring import CategoryScorer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = Path(__file__).resolve().parent / 'data' / 'symptom_database.json'
+
+# File format understood by this module
+FORMAT_VERSION = 1
+
+# Seconds between checks of the file's modification time
+RELOAD_CHECK_SECONDS = 2.0
+
+REQUIRED_FIELDS = (
+    'label', 'keywords', 'specialization', 'specialization_name', 'concern_level',
+    'diet_tips', 'care_instructions',
+)
+
+
+class KnowledgeBase:
+    """One compiled version of the knowledge base; never modified after creation"""
+
+    def __init__(self, data, source=None):
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f'Unsupported knowledge base version: {data.get("version")!r}')
+        categories = data.get('categories')
+        if not isinstance(categories, dict) or 'general' not in categories:
+            raise ValueError('The knowledge base needs a "categories" object with a "general" entry')
+        for name, category in categories.items():
+            missing = [field for field in REQUIRED_FIELDS if field not in category]
+            if missing:
+                raise ValueError(f'Category {name!r} is missing {", ".join(missing)}')
+
+        self.source = source
+        self.database = MappingProxyType(categories)
+        self.scorer = CategoryScorer(categories)
+        self.matcher = KeywordMatcher(self.scorer.terms)
+        # Dropdown choices, with the catch-all first
+        self.choices = [('general', categories['general']['label'])] + [
+            (name, category['label']) for name, category in categories.items() if name != 'general'
+        ]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file), source=str(path))
+
+
+def knowledge_base_path():
+    return getattr(settings, 'SYMPTOM_KNOWLEDGE_BASE', None) or DEFAULT_PATH
+
+
+_current = None
+# (path, mtime) of the last file compiled, successfully or not
+_loaded = None
+_next_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def get_knowledge_base():
+    """
+    Return the current knowledge base. At most every RELOAD_CHECK_SECONDS
+    one caller checks the file and, if it changed, compiles and swaps in
+    the new version; everyone else carries on with the current one.
+    """
+    global _next_check
+    current = _current
+    if current is not None and time.monotonic() < _next_check:
+        return current
+
+    if current is None:
+        # Nothing to fall back on yet, so the first load is waited for
+        with _reload_lock:
+            if _current is None:
+                _reload()
+            return _current
+
+    if _reload_lock.acquire(blocking=False):
+        try:
+            _next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+            _reload()
+        finally:
+            _reload_lock.release()
+    return _current
+
+
+def _reload():
+    """Compile the file if it changed since the last attempt (caller holds the lock)"""
+    global _current, _loaded
+    path = str(knowledge_base_path())
+    try:
+        stamp = (path, os.stat(path).st_mtime_ns)
+        if stamp == _loaded and _current is not None:
+            return
+        # Recorded before compiling so a broken file is reported once, not on every check
+        _loaded = stamp
+        knowledge_base = KnowledgeBase.from_file(path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if _current is None:
+            raise
+        logger.error('Keeping symptom knowledge base from %s, loading %s failed: %s', _current.source, path, e)
+        return
+    _current = knowledge_base
+    logger.info('Loaded symptom knowledge base version %s from %s', FORMAT_VERSION, path)
+
+
+def reload_knowledge_base():
+    """Check the file now instead of waiting for the next interval"""
+    global _next_check
+    with _reload_lock:
+        _next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+        _reload()
+    return _current
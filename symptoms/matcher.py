@@ -0,0 +1,107 @@
+"""
+Keyword matching for the symptom checker
+
+Descriptions are split into word tokens once with a precompiled regex and
+keywords only ever match whole tokens, so 'hot' no longer matches inside
+"photo" nor 'heart' inside "heartburn". One-word keywords are looked up
+in a hash set; multi-word keywords ('shortness of breath') in a trie of
+token sequences. Matching is linear in the number of tokens. Words that
+are not keyword words are tried as plurals and then as typos through a
+trigram index ("hedache" -> headache).
+"""
+import re
+
+from .fuzzy import TrigramIndex
+
+# Words, numbers and simple contractions ("can't")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Plural endings tried when a token is not a keyword word itself
+PLURAL_SUFFIXES = ('es', 's')
+
+
+def tokenize(text):
+    """Return (token, start, end) for each word of the lowercased text"""
+    return [(match.group(), match.start(), match.end()) for match in TOKEN_RE.finditer(text.lower())]
+
+
+class KeywordMatcher:
+    """
+    Whole-word keyword matcher.
+
+    `words` maps single-token keywords to the keyword; `phrases` is a trie
+    whose nodes are {token: (keyword or None, children)}, holding every
+    keyword of two or more tokens. `vocabulary` is every keyword token,
+    used to map plurals ("headaches") and, through `typos`, misspellings
+    in the text onto keyword words.
+    """
+
+    def __init__(self, keywords):
+        self.words = {}
+        self.phrases = {}
+        self.vocabulary = set()
+        self.max_phrase_length = 0
+        for keyword in keywords:
+            self._add(keyword.lower())
+        self.typos = TrigramIndex(self.vocabulary)
+
+    def _add(self, keyword):
+        tokens = [token for token, _, _ in tokenize(keyword)]
+        if not tokens:
+            return
+        self.vocabulary.update(tokens)
+        if len(tokens) == 1:
+            self.words.setdefault(tokens[0], keyword)
+            return
+
+        self.max_phrase_length = max(self.max_phrase_length, len(tokens))
+        node = self.phrases
+        for position, token in enumerate(tokens):
+            found, children = node.get(token, (None, {}))
+            if position == len(tokens) - 1 and found is None:
+                found = keyword
+            node[token] = (found, children)
+            node = children
+
+    def __len__(self):
+        """Number of keywords"""
+        return len(self.words) + self._count(self.phrases)
+
+    def _count(self, node):
+        return sum((found is not None) + self._count(children) for found, children in node.values())
+
+    def canonical(self, token):
+        """
+        The keyword word a text token stands for (plural stripped or typo
+        corrected), or the token itself
+        """
+        if token in self.vocabulary:
+            return token
+        for suffix in PLURAL_SUFFIXES:
+            if token.endswith(suffix) and token[:-len(suffix)] in self.vocabulary:
+                return token[:-len(suffix)]
+        return self.typos.lookup(token) or token
+
+    def find_all(self, text):
+        """
+        Return (keyword, start, end) for every keyword occurrence in text,
+        ordered by start position, positions being in the lowercased text.
+        Overlapping keywords ('chest' and 'chest pain') are all reported.
+        """
+        tokens = tokenize(text)
+        words = [self.canonical(token) for token, _, _ in tokens]
+        matches = []
+        for index, word in enumerate(words):
+            keyword = self.words.get(word)
+            if keyword is not None:
+                matches.append((keyword, tokens[index][1], tokens[index][2]))
+
+            node = self.phrases
+            for position in range(index, min(index + self.max_phrase_length, len(words))):
+                entry = node.get(words[position])
+                if entry is None:
+                    break
+                found, node = entry
+                if found is not None:
+                    matches.append((found, tokens[index][1], tokens[position][2]))
+        return matches
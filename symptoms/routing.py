@@ -0,0 +1,58 @@
+"""
+Routing symptom checker results to doctors
+
+The top available doctors of a specialization come from one query served
+by doctor_routing_idx (specialization, is_available, -rating), with the
+user joined in. Lists are cached per specialization and dropped whenever
+a Doctor save or delete commits (see signals.py).
+
+That only clears the cache of the process that saved the doctor. With a
+shared cache backend (CACHES) every process sees it; with the default
+per-process LocMemCache, other processes keep their lists until they
+expire, so those expire after ROUTING_LOCAL_CACHE_SECONDS.
+"""
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from accounts.models import Doctor
+
+# Doctors suggested under a symptom checker result
+ROUTED_DOCTORS = 3
+
+# Upper bound on staleness for changes that send no Doctor signal (e.g. a renamed user)
+ROUTING_CACHE_SECONDS = 300
+
+# Staleness bound across processes when each has its own cache
+ROUTING_LOCAL_CACHE_SECONDS = 15
+
+
+def routing_cache_seconds():
+    """How long routed doctors stay cached with the configured cache backend"""
+    if isinstance(caches['default'], LocMemCache):
+        return ROUTING_LOCAL_CACHE_SECONDS
+    return ROUTING_CACHE_SECONDS
+
+
+def routing_cache_key(specialization):
+    return f'symptoms:doctors:{specialization}'
+
+
+def recommended_doctors(specialization):
+    """The best rated available doctors of a specialization, cached"""
+    key = routing_cache_key(specialization)
+    doctors = cache.get(key)
+    if doctors is None:
+        doctors = list(
+            Doctor.objects.filter(specialization=specialization, is_available=True)
+            .select_related('user').order_by('-rating')[:ROUTED_DOCTORS]
+        )
+        cache.set(key, doctors, routing_cache_seconds())
+    return doctors
+
+
+def invalidate_recommended_doctors():
+    """
+    Drop every specialization's list: a saved doctor may have just left
+    the one it was cached under
+    """
+    cache.delete_many([routing_cache_key(code) for code, _ in Doctor.SPECIALIZATION_CHOICES])
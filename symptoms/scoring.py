@@ -0,0 +1,55 @@
+"""
+Weighted category scoring for the symptom checker
+
+Every keyword carries a weight for each category that lists it. The
+weights are stored once as a sparse term x category matrix in CSR form
+(one row per keyword), so scoring the keywords found in a description is
+a gather plus a single np.bincount over the categories.
+"""
+import numpy as np
+
+DEFAULT_KEYWORD_WEIGHT = 1.0
+
+
+class CategoryScorer:
+    """Sparse keyword -> category weights with vectorized scoring"""
+
+    def __init__(self, database):
+        self.categories = list(database)
+        self.terms = {}
+        entries = {}
+        for column, (cat_name, cat_data) in enumerate(database.items()):
+            weights = {keyword.lower(): weight for keyword, weight in cat_data.get('keyword_weights', {}).items()}
+            for keyword in cat_data['keywords']:
+                keyword = keyword.lower()
+                term = self.terms.setdefault(keyword, len(self.terms))
+                entries.setdefault(term, {})[column] = weights.get(keyword, DEFAULT_KEYWORD_WEIGHT)
+
+        # CSR layout: row `term` spans columns[indptr[term]:indptr[term + 1]]
+        self.indptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        columns, weights = [], []
+        for term in range(len(self.terms)):
+            row = entries[term]
+            columns.extend(row)
+            weights.extend(row.values())
+            self.indptr[term + 1] = len(columns)
+        self.columns = np.array(columns, dtype=np.int64)
+        self.weights = np.array(weights, dtype=np.float64)
+
+    def scores(self, keywords):
+        """Total weight per category (in database order) of the distinct keywords"""
+        terms = np.fromiter({self.terms[keyword] for keyword in keywords}, dtype=np.int64)
+        starts, stops = self.indptr[terms], self.indptr[terms + 1]
+        lengths = stops - starts
+        # Positions of every stored entry in the matched rows, without a Python loop
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.bincount(self.columns[entries], weights=self.weights[entries], minlength=len(self.categories))
+
+    def rank(self, keywords):
+        """
+        [(category, score)] for categories with a positive score, best
+        first; ties keep database order
+        """
+        scores = self.scores(keywords)
+        order = np.argsort(-scores, kind='stable')
+        return [(self.categories[column], float(scores[column])) for column in order if scores[column] > 0]
@@ -0,0 +1,19 @@
+"""
+Signal handlers for the Symptom Checker
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from accounts.models import Doctor
+from .routing import invalidate_recommended_doctors
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    """
+    Availability, rating or specialization may have changed the routed
+    doctors. Cleared after commit: before it, a concurrent request would
+    cache the old list again.
+    """
+    transaction.on_commit(invalidate_recommended_doctors)
@@ -4,6 +4,21 @@ Symptom Checker Logic
 Rule-based system to analyze symptoms and provide recommendations.
 This is NOT a medical diagnosis tool - just basic guidance.
 """
+from functools import lru_cache
+from types import MappingProxyType
+
+from .knowledge import get_knowledge_base
+from .matcher import tokenize
+
+# Distinct (description, age band, category) results kept in memory
+RESULT_CACHE_SIZE = 4096
+
+
+class CurrentDatabase:
+    """Class attribute that always reads the current knowledge base's categories"""
+    
+    def __get__(self, instance, owner):
+        return get_knowledge_base().database
 
 
 class SymptomChecker:
@@ -11,187 +26,17 @@ class SymptomChecker:
     Rule-based symptom checker with basic health guidance
     """
     
-    # Define symptom categories and their associated information
-    SYMPTOM_DATABASE = {
-        'fever': {
-            'keywords': ['fever', 'high temperature', 'hot', 'burning', 'chills'],
-            'specialization': 'general',
-            'specialization_name': 'General Physician',
-            'concern_level': 'moderate',
-            'diet_tips': [
-                'Drink plenty of fluids (water, coconut water, herbal teas)',
-                'Eat light, easily digestible foods',
-                'Include vitamin C rich fruits like oranges and lemons',
-                'Avoid heavy, fried, or spicy foods',
-            ],
-            'care_instructions': [
-                'Get adequate rest and sleep',
-                'Monitor your temperature regularly',
-                'Use cool compresses if temperature is very high',
-                'Take prescribed fever medication as directed',
-                'If fever persists for more than 3 days or goes above 103°F, consult a doctor immediately',
-            ]
-        },
-        'cough_cold': {
-            'keywords': ['cough', 'cold', 'runny nose', 'sneezing', 'sore throat', 'congestion'],
-            'specialization': 'general',
-            'specialization_name': 'General Physician',
-            'concern_level': 'mild',
-            'diet_tips': [
-                'Drink warm water, herbal teas, and soups',
-                'Consume honey and ginger tea',
-                'Eat vitamin C rich foods',
-                'Avoid cold drinks and ice cream',
-                'Include turmeric milk before bed',
-            ],
-            'care_instructions': [
-                'Get plenty of rest',
-                'Gargle with warm salt water for sore throat',
-                'Use steam inhalation for congestion',
-                'Keep yourself warm',
-                'If symptoms worsen or persist beyond a week, consult a doctor',
-            ]
-        },
-        'stomach_issues': {
-            'keywords': ['stomach', 'abdominal', 'belly', 'nausea', 'vomiting', 'diarrhea', 'constipation', 'acidity'],
-            'specialization': 'gastroenterology',
-            'specialization_name': 'Gastroenterologist',
-            'concern_level': 'moderate',
-            'diet_tips': [
-                'Eat bland foods like rice, bananas, toast',
-                'Stay hydrated with ORS or coconut water',
-                'Avoid spicy, oily, and fried foods',
-                'Eat small, frequent meals',
-                'Include probiotics like yogurt',
-            ],
-            'care_instructions': [
-                'Rest and avoid strenuous activities',
-                'Monitor for signs of dehydration',
-                'Avoid self-medication for severe pain',
-                'If there is blood in stool/vomit or severe pain, seek immediate medical help',
-                'Keep track of what you eat and symptoms',
-            ]
-        },
-        'headache': {
-            'keywords': ['headache', 'head pain', 'migraine', 'head ache'],
-            'specialization': 'neurology',
-            'specialization_name': 'Neurologist',
-            'concern_level': 'mild',
-            'diet_tips': [
-                'Stay well hydrated',
-                'Avoid caffeine and alcohol',
-                'Eat regular, balanced meals',
-                'Include magnesium-rich foods like nuts and seeds',
-                'Avoid processed foods and MSG',
-            ],
-            'care_instructions': [
-                'Rest in a quiet, dark room',
-                'Apply cold or warm compress to head',
-                'Practice relaxation techniques',
-                'Maintain regular sleep schedule',
-                'If headaches are severe, frequent, or accompanied by vision changes, consult a doctor',
-            ]
-        },
-        'chest_discomfort': {
-            'keywords': ['chest', 'chest pain', 'breathing', 'shortness of breath', 'heart'],
-            'specialization': 'cardiology',
-            'specialization_name': 'Cardiologist',
-            'concern_level': 'severe',
-            'diet_tips': [
-                'Avoid heavy meals',
-                'Reduce salt and fat intake',
-                'Stay hydrated',
-                'Avoid caffeine and stimulants',
-            ],
-            'care_instructions': [
-                '⚠️ IMPORTANT: Chest pain can be serious',
-                'If you experience severe chest pain, call emergency services (112/108) immediately',
-                'Do not ignore chest discomfort, especially with sweating, nausea, or arm pain',
-                'Rest and avoid physical exertion',
-                'Seek immediate medical attention',
-            ]
-        },
-        'skin_issues': {
-            'keywords': ['skin', 'rash', 'itching', 'allergy', 'redness', 'acne', 'pimples'],
-            'specialization': 'dermatology',
-            'specialization_name': 'Dermatologist',
-            'concern_level': 'mild',
-            'diet_tips': [
-                'Drink plenty of water for hydration',
-                'Include fruits and vegetables',
-                'Avoid oily and junk food',
-                'Reduce sugar intake',
-                'Include foods rich in Omega-3 fatty acids',
-            ],
-            'care_instructions': [
-                'Keep the affected area clean',
-                'Avoid scratching',
-                'Use mild, fragrance-free soaps',
-                'Apply moisturizer if skin is dry',
-                'Avoid known allergens',
-                'If rash spreads rapidly or is painful, consult a doctor',
-            ]
-        },
-        'joint_pain': {
-            'keywords': ['joint', 'bone', 'arthritis', 'knee', 'back pain', 'muscle pain'],
-            'specialization': 'orthopedics',
-            'specialization_name': 'Orthopedic',
-            'concern_level': 'moderate',
-            'diet_tips': [
-                'Include anti-inflammatory foods',
-                'Consume foods rich in calcium and vitamin D',
-                'Include turmeric and ginger in diet',
-                'Stay hydrated',
-                'Maintain healthy weight',
-            ],
-            'care_instructions': [
-                'Apply ice or heat therapy as appropriate',
-                'Rest the affected area',
-                'Do gentle stretching exercises',
-                'Maintain good posture',
-                'If pain is severe or limits movement, consult a doctor',
-            ]
-        },
-        'mental_health': {
-            'keywords': ['anxiety', 'depression', 'stress', 'mental', 'sleep issues', 'insomnia', 'panic'],
-            'specialization': 'psychiatry',
-            'specialization_name': 'Psychiatrist',
-            'concern_level': 'moderate',
-            'diet_tips': [
-                'Eat balanced, regular meals',
-                'Limit caffeine and sugar',
-                'Include foods rich in Omega-3',
-                'Avoid alcohol',
-                'Stay hydrated',
-            ],
-            'care_instructions': [
-                'Practice relaxation techniques like deep breathing',
-                'Maintain regular sleep schedule',
-                'Exercise regularly',
-                'Stay connected with friends and family',
-                'Seek professional help - mental health is important',
-                'If you have thoughts of self-harm, seek immediate help',
-            ]
-        },
-        'general': {
-            'keywords': [],  # Default category
-            'specialization': 'general',
-            'specialization_name': 'General Physician',
-            'concern_level': 'mild',
-            'diet_tips': [
-                'Eat a balanced diet with fruits and vegetables',
-                'Stay hydrated',
-                'Get adequate sleep',
-                'Exercise regularly',
-            ],
-            'care_instructions': [
-                'Monitor your symptoms',
-                'Get adequate rest',
-                'Maintain good hygiene',
-                'Consult a doctor if symptoms persist or worsen',
-            ]
-        }
-    }
+    # Symptom categories and their associated information, from the
+    # knowledge base file (see knowledge.py); always the current version
+    SYMPTOM_DATABASE = CurrentDatabase()
+    
+    @classmethod
+    def find_keywords(cls, symptom_description):
+        """
+        Scan the description once and return (keyword, start, end) for
+        every keyword occurrence, positions being in the lowercased text
+        """
+        return get_knowledge_base().matcher.find_all(symptom_description)
     
     @classmethod
     def analyze_symptoms(cls, symptom_description, age, gender, category='general'):
@@ -202,49 +47,85 @@ class SymptomChecker:
             symptom_description: Text description of symptoms
             age: Patient's age
             gender: Patient's gender
-            category: Pre-selected category (optional)
+            category: Pre-selected category (optional, 'general' to detect)
         
         Returns:
-            Dictionary with analysis results
+            Read-only mapping with analysis results. Results are cached and
+            shared between requests; layer per-request data on top with
+            collections.ChainMap instead of modifying them.
         """
-        symptom_lower = symptom_description.lower()
+        knowledge_base = get_knowledge_base()
+        if category not in knowledge_base.database:
+            category = 'general'
+        return _cached_analysis(knowledge_base, normalize(symptom_description), age_band(age), category)
+    
+    @classmethod
+    def cache_info(cls):
+        """Hit/miss counters and size of the result cache"""
+        return _cached_analysis.cache_info()
+    
+    @classmethod
+    def cache_clear(cls):
+        _cached_analysis.cache_clear()
+    
+    @classmethod
+    def _analyze(cls, knowledge_base, normalized_description, band, category):
+        """Uncached analysis of a normalized description against one knowledge base version"""
+        matches = knowledge_base.matcher.find_all(normalized_description)
+        
+        # Score every category by the weights of the keywords found
+        ranked = knowledge_base.scorer.rank(keyword for keyword, _, _ in matches)
         
-        # Find matching category based on keywords or use provided category
+        # Use the provided category, or the best scoring one ('general' means "not sure")
         matched_category = None
-        if category and category in cls.SYMPTOM_DATABASE:
+        if category != 'general':
             matched_category = category
-        else:
-            # Search through all categories
-            for cat_name, cat_data in cls.SYMPTOM_DATABASE.items():
-                if cat_name == 'general':
-                    continue
-                for keyword in cat_data['keywords']:
-                    if keyword in symptom_lower:
-                        matched_category = cat_name
-                        break
-                if matched_category:
-                    break
+        elif ranked:
+            matched_category = ranked[0][0]
         
         # Use general if no match found
         if not matched_category:
             matched_category = 'general'
         
-        category_data = cls.SYMPTOM_DATABASE[matched_category]
+        category_data = knowledge_base.database[matched_category]
         
         # Adjust concern level based on age (elderly and children get higher concern)
         concern_level = category_data['concern_level']
-        if age < 5 or age > 65:
+        if band != 'adult':
             if concern_level == 'mild':
                 concern_level = 'moderate'
         
-        # Build result
+        # Build result (tuples and a read-only view, since results are shared)
         result = {
             'category': matched_category,
             'concern_level': concern_level,
+            'specialization': category_data['specialization'],
             'recommended_specialist': category_data['specialization_name'],
-            'diet_tips': category_data['diet_tips'],
-            'care_instructions': category_data['care_instructions'],
+            'diet_tips': tuple(category_data['diet_tips']),
+            'care_instructions': tuple(category_data['care_instructions']),
+            'matched_keywords': tuple(dict.fromkeys(keyword for keyword, _, _ in matches)),
+            'ranked_categories': tuple(ranked),
             'disclaimer': 'This is NOT a medical diagnosis. Please consult a qualified healthcare professional for accurate diagnosis and treatment.'
         }
         
-        return result
+        return MappingProxyType(result)
+
+
+def normalize(symptom_description):
+    """Lowercase words separated by single spaces: the cache key for a description"""
+    return ' '.join(token for token, _, _ in tokenize(symptom_description))
+
+
+def age_band(age):
+    """The only distinction by age the analysis makes"""
+    if age < 5:
+        return 'child'
+    if age > 65:
+        return 'elderly'
+    return 'adult'
+
+
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def _cached_analysis(knowledge_base, normalized_description, band, category):
+    # Keyed on the knowledge base too: after a reload, old results just age out
+    return SymptomChecker._analyze(knowledge_base, normalized_description, band, category)
@@ -0,0 +1,364 @@
+"""
+Tests for the Symptom Checker
+Run with: python manage.py test symptoms
+"""
+import json
+import os
+import random
+import tempfile
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from accounts.models import Doctor
+from hospitals.models import Hospital
+from hospitals.spatial import invalidate_hospital_index
+from symptoms import knowledge
+from symptoms.knowledge import DEFAULT_PATH, get_knowledge_base, reload_knowledge_base
+from symptoms.fuzzy import TrigramIndex, edit_distance
+from symptoms.matcher import KeywordMatcher
+from symptoms.routing import (
+    ROUTING_CACHE_SECONDS, ROUTING_LOCAL_CACHE_SECONDS, recommended_doctors, routing_cache_seconds,
+)
+from symptoms.scoring import CategoryScorer
+from symptoms.symptom_checker import SymptomChecker
+
+
+class KeywordMatcherTest(TestCase):
+    """Test the whole-word keyword matcher"""
+
+    def setUp(self):
+        self.matcher = KeywordMatcher(['hot', 'chest', 'chest pain', 'pain', 'shortness of breath', 'Runny Nose'])
+
+    def test_no_substring_matches(self):
+        """Test that keywords only match whole words"""
+        self.assertEqual(self.matcher.find_all('a photo of my chestnut, painless'), [])
+
+    def test_finds_overlapping_keywords(self):
+        """Test that words and phrases sharing tokens are all reported"""
+        self.assertEqual(
+            self.matcher.find_all('Chest pain, shortness of breath'),
+            [('chest', 0, 5), ('chest pain', 0, 10), ('pain', 6, 10), ('shortness of breath', 12, 31)],
+        )
+
+    def test_partial_phrase_does_not_match(self):
+        """Test that a phrase needs all of its words, in order"""
+        self.assertEqual(self.matcher.find_all('shortness of temper'), [])
+
+    def test_matches_naive_scan(self):
+        """Test against comparing every token window with every keyword"""
+        rng = random.Random(7)
+        vocabulary = ['ache', 'back', 'low', 'pain', 'sharp', 'neck']
+        keywords = {' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 3))) for _ in range(20)}
+        matcher = KeywordMatcher(keywords)
+        words = [rng.choice(vocabulary + ['and']) for _ in range(200)]
+        text = ' '.join(words)
+
+        expected = set()
+        for keyword in keywords:
+            length = len(keyword.split())
+            for index in range(len(words) - length + 1):
+                if words[index:index + length] == keyword.split():
+                    start = len(' '.join(words[:index])) + (1 if index else 0)
+                    expected.add((keyword, start, start + len(keyword)))
+        self.assertEqual(set(matcher.find_all(text)), expected)
+
+    def test_case_and_plurals(self):
+        """Test that matching ignores case and simple plural endings"""
+        self.assertEqual(self.matcher.find_all('RUNNY noses'), [('runny nose', 0, 11)])
+        self.assertEqual(self.matcher.find_all('chest pains'), [('chest', 0, 5), ('chest pain', 0, 11), ('pain', 6, 11)])
+
+
+class TrigramIndexTest(TestCase):
+    """Test typo correction through the trigram index"""
+
+    def setUp(self):
+        self.index = TrigramIndex(['headache', 'vomiting', 'diarrhea', 'shortness', 'cough', 'constipation'])
+
+    def test_edit_distance(self):
+        """Test insertions, deletions, substitutions and swaps count as one"""
+        self.assertEqual(edit_distance('hedache', 'headache', 2), 1)
+        self.assertEqual(edit_distance('haedache', 'headache', 2), 1)
+        self.assertEqual(edit_distance('vomitting', 'vomiting', 2), 1)
+        self.assertEqual(edit_distance('abcdef', 'uvwxyz', 2), 3)
+
+    def test_banded_distance_matches_full_table(self):
+        """Test the banded computation against the plain dynamic program"""
+        def full(a, b):
+            table = [[max(i, j) if not i * j else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+            for i in range(1, len(a) + 1):
+                for j in range(1, len(b) + 1):
+                    table[i][j] = min(table[i - 1][j] + 1, table[i][j - 1] + 1,
+                                      table[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+                    if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                        table[i][j] = min(table[i][j], table[i - 2][j - 2] + 1)
+            return table[-1][-1]
+
+        rng = random.Random(3)
+        for _ in range(500):
+            a = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 7)))
+            b = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 7)))
+            for limit in (1, 2):
+                self.assertEqual(edit_distance(a, b, limit), min(full(a, b), limit + 1), (a, b, limit))
+
+    def test_corrects_common_typos(self):
+        """Test that misspellings resolve to the keyword word"""
+        for typo, word in [('hedache', 'headache'), ('vomitting', 'vomiting'), ('diarhea', 'diarrhea'),
+                           ('constpaton', 'constipation')]:
+            self.assertEqual(self.index.lookup(typo), word)
+
+    def test_leaves_other_words_alone(self):
+        """Test that short or distant words are not corrected"""
+        self.assertIsNone(self.index.lookup('tough'))
+        self.assertIsNone(self.index.lookup('hardware'))
+        self.assertIsNone(self.index.lookup('headaches2'))
+
+
+class CategoryScorerTest(TestCase):
+    """Test the sparse keyword weight matrix"""
+
+    def setUp(self):
+        self.scorer = CategoryScorer({
+            'a': {'keywords': ['pain', 'ache'], 'keyword_weights': {'ache': 2.5}},
+            'b': {'keywords': ['pain', 'sore']},
+            'c': {'keywords': []},
+        })
+
+    def test_scores_sum_keyword_weights(self):
+        """Test that shared keywords count towards every category listing them"""
+        self.assertEqual(list(self.scorer.scores(['pain', 'ache', 'sore'])), [3.5, 2.0, 0.0])
+
+    def test_repeated_keywords_count_once(self):
+        """Test that repeating a keyword does not inflate its category"""
+        self.assertEqual(list(self.scorer.scores(['pain', 'pain'])), [1.0, 1.0, 0.0])
+
+    def test_rank_orders_by_score(self):
+        """Test ranking, with ties in database order and no zero scores"""
+        self.assertEqual(self.scorer.rank(['sore', 'pain']), [('b', 2.0), ('a', 1.0)])
+        self.assertEqual(self.scorer.rank(['pain']), [('a', 1.0), ('b', 1.0)])
+        self.assertEqual(self.scorer.rank([]), [])
+
+
+class SymptomCheckerTest(TestCase):
+    """Test SymptomChecker.analyze_symptoms"""
+
+    def test_keyword_selects_category(self):
+        """Test that a keyword in the description selects its category"""
+        result = SymptomChecker.analyze_symptoms('I have a bad migraine', 30, 'F', category=None)
+        self.assertEqual(result['category'], 'headache')
+        self.assertEqual(result['recommended_specialist'], 'Neurologist')
+        self.assertEqual(result['matched_keywords'], ('migraine',))
+
+    def test_no_match_falls_back_to_general(self):
+        """Test that unknown symptoms use the general category"""
+        result = SymptomChecker.analyze_symptoms('feeling odd', 30, 'M', category=None)
+        self.assertEqual(result['category'], 'general')
+
+    def test_age_raises_concern(self):
+        """Test that mild symptoms are moderate for young children"""
+        result = SymptomChecker.analyze_symptoms('rash on arm', 3, 'M', category=None)
+        self.assertEqual(result['category'], 'skin_issues')
+        self.assertEqual(result['concern_level'], 'moderate')
+
+    def test_best_scoring_category_wins(self):
+        """Test that categories are scored rather than taken in database order"""
+        result = SymptomChecker.analyze_symptoms('chest pain and fever', 40, 'M')
+        self.assertEqual(result['category'], 'chest_discomfort')
+        self.assertEqual(result['concern_level'], 'severe')
+        self.assertEqual(result['recommended_specialist'], 'Cardiologist')
+        self.assertEqual([name for name, _ in result['ranked_categories']], ['chest_discomfort', 'fever'])
+
+    def test_no_false_positives_from_substrings(self):
+        """Test that words merely containing a keyword do not count"""
+        result = SymptomChecker.analyze_symptoms('heartburn after I was scolded in the photo', 30, 'F')
+        self.assertNotIn('chest_discomfort', dict(result['ranked_categories']))
+        self.assertEqual(result['category'], 'stomach_issues')
+
+    def test_misspelt_symptoms(self):
+        """Test that typos no longer fall through to general"""
+        for text, category in [('bad hedache', 'headache'), ('vomitting and diarhea', 'stomach_issues'),
+                               ('shortnes of breath', 'chest_discomfort')]:
+            self.assertEqual(SymptomChecker.analyze_symptoms(text, 30, 'M')['category'], category)
+
+    def test_selected_category_is_kept(self):
+        """Test that an explicitly chosen category overrides detection"""
+        result = SymptomChecker.analyze_symptoms('chest pain and fever', 40, 'M', category='fever')
+        self.assertEqual(result['category'], 'fever')
+
+
+class SymptomCacheTest(TestCase):
+    """Test the result cache of SymptomChecker"""
+
+    def setUp(self):
+        SymptomChecker.cache_clear()
+
+    def test_equivalent_requests_share_a_result(self):
+        """Test that case, spacing and ages within a band hit the cache"""
+        first = SymptomChecker.analyze_symptoms('Cough and cold', 30, 'M')
+        second = SymptomChecker.analyze_symptoms('  cough AND cold!', 50, 'F', category=None)
+        self.assertIs(first, second)
+        info = SymptomChecker.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+        child = SymptomChecker.analyze_symptoms('cough and cold', 3, 'M')
+        self.assertIsNot(child, first)
+        self.assertEqual(child['concern_level'], 'moderate')
+
+    def test_results_are_read_only(self):
+        """Test that a shared result cannot be modified by one caller"""
+        result = SymptomChecker.analyze_symptoms('fever', 30, 'M')
+        with self.assertRaises(TypeError):
+            result['category'] = 'headache'
+        with self.assertRaises(AttributeError):
+            result['diet_tips'].append('anything')
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_form_data_layered_on_result(self):
+        """Test that the page shows per-request form data without touching the cache"""
+        response = self.client.post(reverse('symptoms:symptom_checker'), {
+            'symptoms': 'fever', 'age': '30', 'gender': 'M', 'category': 'general',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result']['form_data']['symptoms'], 'fever')
+        self.assertEqual(response.context['result']['category'], 'fever')
+        self.assertNotIn('form_data', SymptomChecker.analyze_symptoms('fever', 30, 'M'))
+
+
+class KnowledgeBaseReloadTest(TestCase):
+    """Test loading and hot reloading the knowledge base file"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'symptoms.json')
+        with open(DEFAULT_PATH, encoding='utf-8') as file:
+            self.data = json.load(file)
+        self.write()
+
+        settings = override_settings(SYMPTOM_KNOWLEDGE_BASE=self.path)
+        settings.enable()
+        self.addCleanup(reload_knowledge_base)
+        self.addCleanup(settings.disable)
+        reload_knowledge_base()
+
+    def write(self, text=None):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(text if text is not None else json.dumps(self.data))
+        # Make sure the change is visible even on coarse mtime filesystems
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def test_edits_are_picked_up(self):
+        """Test that a changed file replaces the matcher and cached results"""
+        self.assertEqual(SymptomChecker.analyze_symptoms('feeling tired', 30, 'M')['category'], 'general')
+
+        self.data['categories']['fever']['keywords'].append('tired')
+        self.write()
+        reload_knowledge_base()
+        self.assertEqual(SymptomChecker.analyze_symptoms('feeling tired', 30, 'M')['category'], 'fever')
+
+    def test_broken_file_keeps_current_version(self):
+        """Test that a bad edit does not take the symptom checker down"""
+        current = get_knowledge_base()
+        self.write('{"version": 1, "categories": ')
+        with self.assertLogs('symptoms.knowledge', 'ERROR'):
+            self.assertIs(reload_knowledge_base(), current)
+
+        del self.data['categories']['general']
+        self.write()
+        with self.assertLogs('symptoms.knowledge', 'ERROR'):
+            self.assertIs(reload_knowledge_base(), current)
+
+    def test_reload_does_not_block_readers(self):
+        """Test that requests use the current version while a reload runs"""
+        current = get_knowledge_base()
+        knowledge._next_check = 0
+        with knowledge._reload_lock:
+            self.assertIs(get_knowledge_base(), current)
+
+    def test_dropdown_follows_file(self):
+        """Test that the category choices come from the file, general first"""
+        choices = get_knowledge_base().choices
+        self.assertEqual(choices[0], ('general', 'General / Other'))
+        self.assertIn(('chest_discomfort', 'Chest Discomfort'), choices)
+
+
+class DoctorRoutingTest(TestCase):
+    """Test routing symptom checker results to doctors"""
+
+    def setUp(self):
+        cache.clear()
+        # The emergency index is process-wide and test transactions never commit
+        invalidate_hospital_index()
+        for index, (rating, available) in enumerate([(4.9, False), (4.8, True), (4.2, True), (4.6, True), (3.9, True)]):
+            user = get_user_model().objects.create_user(
+                username=f'cardio{index}', role='doctor', first_name=f'Card{index}'
+            )
+            Doctor.objects.create(
+                user=user, specialization='cardiology', qualification='MD', clinic_hospital='City Hospital',
+                rating=Decimal(str(rating)), is_available=available,
+            )
+
+    def test_top_available_doctors_in_one_query(self):
+        """Test the query joins users, skips unavailable doctors and is cached"""
+        with self.assertNumQueries(1):
+            doctors = recommended_doctors('cardiology')
+            self.assertEqual([doctor.user.username for doctor in doctors], ['cardio1', 'cardio3', 'cardio2'])
+        with self.assertNumQueries(0):
+            recommended_doctors('cardiology')
+
+    def test_availability_change_invalidates(self):
+        """Test that saving a doctor refreshes the cached candidates"""
+        recommended_doctors('cardiology')
+        doctor = Doctor.objects.get(user__username='cardio1')
+        doctor.is_available = False
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.save()
+        self.assertNotIn('cardio1', [doctor.user.username for doctor in recommended_doctors('cardiology')])
+
+        doctor.specialization = 'neurology'
+        doctor.is_available = True
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.save()
+        self.assertEqual([doctor.user.username for doctor in recommended_doctors('neurology')], ['cardio1'])
+
+    def test_cache_waits_for_commit(self):
+        """Test that an uncommitted doctor change leaves the cached list alone"""
+        doctors = recommended_doctors('cardiology')
+        doctor = Doctor.objects.get(user__username='cardio1')
+        doctor.is_available = False
+        with self.captureOnCommitCallbacks() as callbacks:
+            doctor.save()
+        self.assertEqual(recommended_doctors('cardiology'), doctors)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_per_process_cache_expires_sooner(self):
+        """Test that lists in a per-process cache use the short staleness bound"""
+        self.assertEqual(routing_cache_seconds(), ROUTING_LOCAL_CACHE_SECONDS)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual(routing_cache_seconds(), ROUTING_CACHE_SECONDS)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_result_page_lists_doctors(self):
+        """Test that a severe chest result shows cardiologists to book"""
+        response = self.client.post(reverse('symptoms:symptom_checker'), {
+            'symptoms': 'chest pain', 'age': '50', 'gender': 'M', 'category': 'general',
+        })
+        self.assertEqual([doctor.user.username for doctor in response.context['result']['doctors']],
+                         ['cardio1', 'cardio3', 'cardio2'])
+        self.assertContains(response, reverse('appointments:book_appointment_doctor', args=[Doctor.objects.get(user__username='cardio1').pk]))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_severe_result_inlines_nearest_emergency_hospitals(self):
+        """Test that severe symptoms with a location list the nearest emergency hospitals"""
+        Hospital.objects.create(name='AIIMS Delhi', state='Delhi', latitude=28.5672, longitude=77.2100, has_emergency=True)
+        Hospital.objects.create(name='Clinic Delhi', state='Delhi', latitude=28.6140, longitude=77.2091)
+        form = {'symptoms': 'chest pain', 'age': '50', 'gender': 'M', 'category': 'general',
+                'lat': '28.6139', 'lon': '77.2090'}
+
+        response = self.client.post(reverse('symptoms:symptom_checker'), form)
+        self.assertEqual([h['name'] for h in response.context['result']['emergency_hospitals']], ['AIIMS Delhi'])
+
+        response = self.client.post(reverse('symptoms:symptom_checker'), dict(form, symptoms='mild rash'))
+        self.assertNotIn('emergency_hospitals', response.context['result'])
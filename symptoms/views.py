@@ -1,7 +1,11 @@
 """
 Views for Symptom Checker
 """
+from collections import ChainMap
 from django.shortcuts import render
+from hospitals.spatial import nearest_emergency_hospitals, parse_coordinates
+from .knowledge import get_knowledge_base
+from .routing import recommended_doctors
 from .symptom_checker import SymptomChecker
 
 
@@ -25,26 +29,24 @@ def symptom_checker(request):
             category=category
         )
         
-        # Add form data to result for display
-        result['form_data'] = {
-            'symptoms': symptom_description,
-            'age': age,
-            'gender': gender,
-            'category': category,
-        }
+        # Add form data and matching doctors on top of the shared (cached) result
+        result = ChainMap({
+            'form_data': {
+                'symptoms': symptom_description,
+                'age': age,
+                'gender': gender,
+                'category': category,
+            },
+            'doctors': recommended_doctors(result['specialization']),
+        }, result)
+        
+        # Severe symptoms: inline the nearest emergency hospitals (served from memory)
+        coordinates = parse_coordinates(request.POST.get('lat'), request.POST.get('lon'))
+        if result['concern_level'] == 'severe' and coordinates:
+            result.maps[0]['emergency_hospitals'] = nearest_emergency_hospitals(*coordinates)
     
-    # Get categories for dropdown
-    categories = [
-        ('general', 'General / Other'),
-        ('fever', 'Fever'),
-        ('cough_cold', 'Cough/Cold'),
-        ('stomach_issues', 'Stomach Issues'),
-        ('headache', 'Headache'),
-        ('chest_discomfort', 'Chest Discomfort'),
-        ('skin_issues', 'Skin Issues'),
-        ('joint_pain', 'Joint/Bone Pain'),
-        ('mental_health', 'Mental Health / Stress'),
-    ]
+    # Get categories for dropdown (from the same knowledge base as the analysis)
+    categories = get_knowledge_base().choices
     
     context = {
         'result': result,